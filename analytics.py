@@ -0,0 +1,277 @@
+import math
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from config import site_config, site_phases, sites
+from datedim import add_date_columns, assign_phases
+from filters import FilterSpec, apply_filters
+from rolling import add_rolling, rolling_names
+from rollup import daily_counts, date_range, get_rollup, phase_retention, repeat_visits_per_week, weekly_streaks
+from schema import day_of_week_dtype
+from stats import phase_tests
+
+# everything the dashboard shows, as plain frames - no streamlit in here so it can run headless
+
+# line charts never get more than this many points per series - longer ones are averaged into date bins
+chart_max_points = 500
+
+
+def compare_column(compare_option):
+    return 'Phase' if compare_option == 'Experiment' else 'Quarter'
+
+
+def unique_swipes_per_day(df, combined=False):
+    if combined:
+        return df.groupby(['Access Date', 'Phase'], observed=True).size().rename('Swipe Count').reset_index(level=0)
+    else:
+        return df.groupby('Access Date').size().rename('Swipe Count').reset_index(level=0)
+
+
+def swipe_counts(rollup, site, person_type_contains=None, pct=False):
+    # unique swipes per day, labelled with everything the charts split by
+    df = daily_counts(rollup, person_type_contains)
+    if pct:
+        df['Pct Lab Population'] = df['Swipe Count'] / site.population
+    add_date_columns(df, ['Day Of Week', 'Quarter', 'Phase'], site.phases)
+    df['Day Of Week'] = df['Day Of Week'].astype(day_of_week_dtype)
+    return df
+
+
+def add_swipe_rolling(swipes, employee_swipes, key):
+    # 7d / 28d averages & week over week change for the line charts; day_of_week is each weekday's own series,
+    # averaged over its last 4 weeks
+    swipes = add_rolling(swipes, 'Swipe Count', key + ('swipes',))
+    employee_swipes = add_rolling(employee_swipes, 'Pct Lab Population', key + ('employee_swipes',))
+    day_of_week = add_rolling(swipes[['Access Date', 'Day Of Week', 'Swipe Count']], 'Swipe Count',
+                              key + ('day_of_week',), by='Day Of Week', windows=(28,))
+    return swipes, employee_swipes, day_of_week
+
+
+def summary_stats(df, columns, by=None):
+    if by is None:
+        return df[columns].describe()
+    return df.groupby(by, observed=True)[columns].describe()
+
+
+def repeat_visits_distribution(repeat_visits):
+    # how many person-weeks had 1, 2, ... visits
+    df = repeat_visits.groupby(['Repeat Visits Per Week']).size().to_frame(
+        name='Total Times Card Swiped X Times a Week')
+    total_visits = df['Total Times Card Swiped X Times a Week'].sum()
+    df['Percent'] = df['Total Times Card Swiped X Times a Week'] / total_visits
+    return df.reset_index()
+
+
+def streak_distribution(streaks):
+    # how many people's longest run of consecutive weeks with a visit was 1, 2, ... weeks
+    df = streaks.groupby('Longest Streak').size().to_frame(name='People')
+    df['Percent'] = df['People'] / df['People'].sum()
+    return df.rename_axis('Longest Streak (Weeks)').reset_index()
+
+
+def boxplot_stats(df, column, by=None, whisker=1.5):
+    # what a vega boxplot would otherwise compute in the browser from every row:
+    # one 'box' row per group (quartiles & whiskers) plus one 'outlier' row per point outside the whiskers
+    keys = [by] if isinstance(by, str) else list(by or [])
+    if not keys:
+        df = df.assign(_group=0)
+        keys = ['_group']
+    grouped = df.groupby(keys, observed=True)[column]
+    box = grouped.quantile([.25, .5, .75]).unstack()
+    box.columns = ['q1', 'median', 'q3']
+    iqr = box['q3'] - box['q1']
+    box['low_fence'] = box['q1'] - whisker * iqr
+    box['high_fence'] = box['q3'] + whisker * iqr
+
+    values = df[keys + [column]].join(box[['low_fence', 'high_fence']], on=keys)
+    inside = values[column].between(values['low_fence'], values['high_fence'])
+    # whiskers stop at the most extreme values still inside the fences
+    whiskers = values[inside].groupby(keys, observed=True)[column].agg(lower='min', upper='max')
+    box = box.drop(columns=['low_fence', 'high_fence']).join(whiskers).reset_index()
+    outliers = values.loc[~inside, keys + [column]].rename(columns={column: 'value'})
+    box = pd.concat([box.assign(kind='box'), outliers.assign(kind='outlier')], ignore_index=True)
+    return box.drop(columns=['_group'], errors='ignore')
+
+
+def downsample(df, columns, by=None, max_points=chart_max_points):
+    keys = [by] if isinstance(by, str) else list(by or [])
+    series = df.groupby(keys, observed=True).ngroups if keys else 1
+    if len(df) <= max_points * series:
+        return df[['Access Date'] + keys + columns]
+    # equal-width date bins, averaged, so each series has at most max_points points
+    span_days = (df['Access Date'].max() - df['Access Date'].min()).days + 1
+    grouper = pd.Grouper(key='Access Date', freq=f'{math.ceil(span_days / max_points)}D')
+    return df.groupby([grouper] + keys, observed=True)[columns].mean().dropna().reset_index()
+
+
+def repeat_visits_by_week(repeat_visits):
+    # people per Year-Week by how many days they came in that week
+    return (
+        repeat_visits.groupby(['Year-Week', 'Repeat Visits Per Week'])
+        .size()
+        .rename('People')
+        .reset_index()
+    )
+
+
+def overview(rollup, site):
+    first_date, last_date = date_range(rollup)
+    return pd.DataFrame([{
+        'Site': site.name,
+        'First Date': first_date,
+        'Last Date': last_date,
+        'Experiment Start': pd.Timestamp(site.experiment_start_date),
+        'Lab Population': site.population,
+    }])
+
+
+def phase_marks(rollup, site):
+    # the site's phases for chart rules & labels, open ends clipped to the data
+    first_date, last_date = date_range(rollup)
+    phases = site_phases(site)
+    phases['start'] = phases['start'].fillna(first_date).clip(lower=first_date)
+    phases['end'] = phases['end'].fillna(last_date).clip(upper=last_date)
+    return phases[phases['start'] <= phases['end']].reset_index(drop=True)
+
+
+def site_summary(rollup):
+    # every site's headline numbers per phase, from one groupby over the daily rollup
+    daily = rollup.daily
+    employee = daily['Person Type'].str.contains('EMPLOYEE').to_numpy()
+    per_day = (
+        daily.assign(**{'Employee Swipe Count': daily['Swipe Count'].where(employee, 0)})
+        .groupby(['Site', 'Access Date'], observed=True)[['Swipe Count', 'Employee Swipe Count']]
+        .sum()
+        .reset_index()
+    )
+    per_day = per_day.astype({'Site': 'object'})
+    per_day['Population'] = per_day['Site'].map({name: site.population for name, site in sites.items()})
+    # each site's own phase table; sites missing from the registry are one 'All' phase with no population
+    per_day['Phase'] = None
+    for name, rows in per_day.groupby('Site').indices.items():
+        phases = sites[name].phases if name in sites else (('All', None, None),)
+        per_day.iloc[rows, per_day.columns.get_loc('Phase')] = assign_phases(
+            per_day['Access Date'].iloc[rows], phases).astype(object)
+    per_day['Pct Lab Population'] = per_day['Employee Swipe Count'] / per_day['Population']
+    summary = per_day.groupby(['Site', 'Phase']).agg(**{
+        'Days': ('Access Date', 'size'),
+        'First Date': ('Access Date', 'min'),
+        'Last Date': ('Access Date', 'max'),
+        'Population': ('Population', 'first'),
+        'Mean Swipes Per Day': ('Swipe Count', 'mean'),
+        'Max Swipes Per Day': ('Swipe Count', 'max'),
+        'Mean Pct Lab Population': ('Pct Lab Population', 'mean'),
+    })
+    return summary.reset_index().sort_values(['Site', 'First Date'], ignore_index=True)
+
+
+def door_utilization(door_counts, rollup):
+    # swipes per reader from the door counts kept at cleaning (cleaning.count_door_swipes), limited to the
+    # site / day / person type rows left in the filtered data, so the sidebar filters apply to them too.
+    # one row per reader x transaction type
+    if door_counts is None or door_counts.empty or 'Reader Description' not in door_counts:
+        return pd.DataFrame()
+    keys = [column for column in ['Site', 'Access Date', 'Person Type']
+            if column in door_counts and column in rollup.daily]
+    kept = pd.MultiIndex.from_frame(rollup.daily[keys].astype({'Person Type': 'object'}))
+    rows = pd.MultiIndex.from_frame(door_counts[keys].astype({'Person Type': 'object'})).isin(kept)
+    door_counts = door_counts[rows]
+    if 'Transaction Type' not in door_counts:
+        door_counts = door_counts.assign(**{'Transaction Type': 'All'})
+    by = ['Reader Description', 'Transaction Type']
+    daily = door_counts.groupby(['Access Date'] + by, observed=True)['Swipes'].sum().reset_index()
+    summary = daily.groupby(by, observed=True).agg(**{
+        'Swipes': ('Swipes', 'sum'),
+        'Days': ('Access Date', 'nunique'),
+    }).reset_index()
+    summary['Mean Swipes Per Day'] = summary['Swipes'] / rollup.days.size
+    summary['Share Of Swipes'] = summary['Swipes'] / summary['Swipes'].sum()
+    return summary.sort_values('Swipes', ascending=False, ignore_index=True)
+
+
+def generate_fake_data(df):
+    # add 2 months to baseline data
+    faux_df = df.copy()
+    # dates are shifted below, so this is no longer the uploaded dataset
+    faux_df.attrs.pop('fingerprint', None)
+    # shift each distinct date once & map it back onto the rows
+    codes, dates = pd.factorize(df['Access Date'])
+    shifted = pd.DatetimeIndex([date + relativedelta(months=+4) for date in dates])
+    faux_df['Access Date'] = shifted.to_numpy()[codes]
+    add_date_columns(faux_df, ['Day Of Week'])
+    faux_df = apply_filters(faux_df, FilterSpec(remove_weekends=True))
+    df = pd.concat([df, faux_df], ignore_index=True)
+    return df
+
+
+def sites_report(df):
+    return {'sites': site_summary(get_rollup(df))}
+
+
+def baseline_report(df, site=None, door_counts=None):
+    # df holds one site's data - site is its SiteConfig (the default site if None).
+    # door_counts: cleaning.count_door_swipes of the same upload, unfiltered
+    site = site or site_config()
+    rollup = get_rollup(df)
+    swipes = swipe_counts(rollup, site)
+    # Employee only data for some graphs
+    employee_swipes = swipe_counts(rollup, site, person_type_contains="EMPLOYEE", pct=True)
+    swipes, employee_swipes, day_of_week = add_swipe_rolling(swipes, employee_swipes, (site.name,))
+    repeat_visits = repeat_visits_per_week(rollup)
+    return {
+        'overview': overview(rollup, site),
+        'phases': phase_marks(rollup, site),
+        'swipes': swipes,
+        'swipes_summary': summary_stats(swipes, ['Swipe Count']),
+        'swipes_box': boxplot_stats(swipes, 'Swipe Count'),
+        'swipes_line': downsample(swipes, ['Swipe Count'] + rolling_names('Swipe Count')),
+        'employee_swipes': employee_swipes,
+        'employee_swipes_summary': summary_stats(employee_swipes, ['Swipe Count', 'Pct Lab Population']),
+        'employee_swipes_box': boxplot_stats(employee_swipes, 'Pct Lab Population'),
+        'employee_swipes_line': downsample(
+            employee_swipes, ['Pct Lab Population'] + rolling_names('Pct Lab Population')),
+        'day_of_week_summary': summary_stats(swipes, 'Swipe Count', by='Day Of Week'),
+        'day_of_week_box': boxplot_stats(swipes, 'Swipe Count', by='Day Of Week'),
+        'day_of_week_line': downsample(day_of_week, ['Swipe Count', 'Swipe Count 28d Avg'], by='Day Of Week'),
+        'repeat_visits_distribution': repeat_visits_distribution(repeat_visits),
+        'repeat_visits_by_week': repeat_visits_by_week(repeat_visits),
+        'streaks': streak_distribution(weekly_streaks(rollup)),
+        'door_summary': door_utilization(door_counts, rollup),
+    }
+
+
+def comparison_report(df, compare_option="Experiment", debug=False, site=None):
+    site = site or site_config()
+    if debug:
+        df = generate_fake_data(df)
+    rollup = get_rollup(df)
+    compare = compare_column(compare_option)
+    swipes = swipe_counts(rollup, site)
+    employee_swipes = swipe_counts(rollup, site, person_type_contains="EMPLOYEE", pct=True)
+    if debug:
+        # Randomly add or subtract up to 5 swipes per day
+        np.random.seed(42)
+        swipes['Swipe Count'] = swipes['Swipe Count'] + np.random.randint(-5, 5)
+        employee_swipes['Swipe Count'] = employee_swipes['Swipe Count'] + np.random.randint(-5, 5)
+        employee_swipes['Pct Lab Population'] = employee_swipes['Swipe Count'] / site.population
+    swipes, employee_swipes, day_of_week = add_swipe_rolling(swipes, employee_swipes, (site.name, debug))
+    return {
+        'overview': overview(rollup, site),
+        'phases': phase_marks(rollup, site),
+        'swipes': swipes,
+        'swipes_summary': summary_stats(swipes, ['Swipe Count'], by=compare),
+        'swipes_box': boxplot_stats(swipes, 'Swipe Count', by=compare),
+        'swipes_line': downsample(swipes, ['Swipe Count'] + rolling_names('Swipe Count')),
+        'employee_swipes': employee_swipes,
+        'employee_swipes_summary': summary_stats(employee_swipes, ['Swipe Count', 'Pct Lab Population'], by=compare),
+        'employee_swipes_box': boxplot_stats(employee_swipes, 'Pct Lab Population', by=compare),
+        'employee_swipes_line': downsample(
+            employee_swipes, ['Pct Lab Population'] + rolling_names('Pct Lab Population')),
+        'day_of_week_summary': summary_stats(swipes, 'Swipe Count', by=['Day Of Week', compare]),
+        'day_of_week_box': boxplot_stats(swipes, 'Swipe Count', by=['Day Of Week', compare]),
+        'day_of_week_line': downsample(day_of_week, ['Swipe Count', 'Swipe Count 28d Avg'], by='Day Of Week'),
+        # every phase against the baseline - these don't depend on compare_option
+        'phase_tests': phase_tests(swipes),
+        'day_of_week_tests': phase_tests(swipes, by='Day Of Week'),
+        'retention': phase_retention(rollup, site.phases),
+    }
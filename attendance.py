@@ -0,0 +1,86 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+# who came in on which day, as one row of packed bits per person (bit i = the i-th day of the dataset).
+# visits in any set of days are a popcount of the row masked by that set's bits
+_popcount = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+@dataclass
+class Attendance:
+    # sorted unique person ids / dates - rows & bit positions of bits
+    persons: pd.Index
+    days: pd.Index
+    # uint8, persons x ceil(days / 8), big endian bit order as np.packbits
+    bits: np.ndarray
+
+
+def build_attendance(person_codes, day_codes, persons, days):
+    # person_codes / day_codes: one entry per swipe row, indexes into persons / days. duplicates are fine
+    person_codes = np.asarray(person_codes, dtype=np.intp)
+    day_codes = np.asarray(day_codes, dtype=np.intp)
+    bits = np.zeros((len(persons), -(-len(days) // 8)), dtype=np.uint8)
+    np.bitwise_or.at(bits, (person_codes, day_codes >> 3), (0x80 >> (day_codes & 7)).astype(np.uint8))
+    return Attendance(persons=pd.Index(persons), days=pd.Index(days), bits=bits)
+
+
+def day_mask(selected):
+    # packed mask of the days where selected (a bool per day) is true
+    return np.packbits(np.asarray(selected, dtype=bool))
+
+
+def count_days(attendance, mask=None):
+    # days each person came in, among the days in mask (all days if None)
+    bits = attendance.bits if mask is None else attendance.bits & mask
+    return _popcount[bits].sum(axis=1, dtype=np.int32)
+
+
+def period_counts(attendance, periods, sort=True):
+    # periods: a label per day (e.g. Year-Week, NaN for days in none). persons x periods matrix of days visited,
+    # & the period labels - sorted, or in date order if not sort
+    codes, labels = pd.factorize(np.asarray(periods), sort=sort)
+    counts = np.empty((len(attendance.persons), len(labels)), dtype=np.int32)
+    for code in range(len(labels)):
+        counts[:, code] = count_days(attendance, day_mask(codes == code))
+    return counts, labels
+
+
+def visits_per_period(attendance, periods, period_name, visits_name):
+    # one row per person & period they came in at least once
+    counts, labels = period_counts(attendance, periods)
+    person, period = np.nonzero(counts)
+    return pd.DataFrame({
+        'anon_id': attendance.persons[person],
+        period_name: labels[period],
+        visits_name: counts[person, period],
+    })
+
+
+def active_streaks(attendance, periods):
+    # per person: periods active, the longest run of consecutive active periods & the run up to the last period.
+    # only periods present in the data count, so a week with no data (e.g. filtered holidays) doesn't break a run
+    counts, labels = period_counts(attendance, periods)
+    active = counts > 0
+    run_total = np.cumsum(active, axis=1)
+    # total at the last inactive period, carried forward - subtracting it restarts the count after each gap
+    restart = np.maximum.accumulate(np.where(active, 0, run_total), axis=1)
+    runs = run_total - restart
+    return pd.DataFrame({
+        'anon_id': attendance.persons,
+        'Active Periods': active.sum(axis=1),
+        'Longest Streak': runs.max(axis=1, initial=0),
+        'Current Streak': runs[:, -1] if len(labels) else 0,
+    })
+
+
+def cohort_retention(attendance, phases):
+    # phases: a phase label per day (NaN outside any phase). people are grouped by the first phase they came in;
+    # the share of each cohort that came in at least once in every phase
+    counts, labels = period_counts(attendance, phases, sort=False)
+    active = counts > 0
+    seen = active.any(axis=1)
+    cohorts = pd.Categorical.from_codes(active.argmax(axis=1), categories=labels)[seen]
+    retention = pd.DataFrame(active[seen], columns=labels).groupby(cohorts, observed=True).mean()
+    retention.insert(0, 'People', pd.Series(cohorts).value_counts().reindex(retention.index).to_numpy())
+    return retention.rename_axis('Cohort').reset_index()
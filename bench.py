@@ -0,0 +1,113 @@
+import argparse
+import json
+import sys
+import time
+import pandas as pd
+from analytics import repeat_visits_by_week, repeat_visits_distribution, unique_swipes_per_day
+from cleaning import clean_df, clean_file
+from export import export_file, export_formats
+from filters import FilterSpec, apply_filters, default_holidays
+from rollup import build_rollup, repeat_visits_per_week
+from synthetic import synthetic_csv, synthetic_export
+
+# times the pipeline stages on synthetic exports of a few sizes:
+#   python bench.py --rows 10000 100000 1000000 --out bench.json
+#   python bench.py --rows 10000 100000 1000000 --compare bench.json   # exits 1 on a regression
+bench_rows = (10_000, 100_000, 1_000_000)
+bench_repeat = 5
+# a stage counts as regressed when its median time is this much slower than the saved run, & by at least
+# regression_floor seconds - millisecond stages swing by more than the tolerance on noise alone
+regression_tolerance = .25
+regression_floor = .05
+
+
+def swiper_patterns_data(df):
+    # what the swiper patterns charts are drawn from
+    repeat_visits = repeat_visits_per_week(build_rollup(df))
+    return repeat_visits_distribution(repeat_visits), repeat_visits_by_week(repeat_visits)
+
+
+def stages(raw, data):
+    # (name, setup, stage) - setup runs untimed before every repeat & its result is passed to stage.
+    # data is raw as the bytes of an uploaded .csv
+    clean = clean_df(raw.copy())
+    return [
+        ('clean_df', lambda: raw.copy(), clean_df),
+        # parsing included, as an upload is cleaned
+        ('clean_file', lambda: data, lambda data: clean_file('bench.csv', data)),
+        ('filter weekends', lambda: clean, lambda df: apply_filters(df, FilterSpec(remove_weekends=True))),
+        ('filter holidays', lambda: clean, lambda df: apply_filters(df, FilterSpec(holidays=default_holidays))),
+        ('filter person types', lambda: clean,
+         lambda df: apply_filters(df, FilterSpec(person_types=frozenset(['EMPLOYEE'])))),
+        ('unique_swipes_per_day', lambda: clean, unique_swipes_per_day),
+        ('swiper_patterns', lambda: clean, swiper_patterns_data),
+    ] + [
+        # what the download buttons serve
+        (f'export {label}', lambda: clean, lambda df, label=label: export_file(df, label)) for label in export_formats
+    ]
+
+
+def time_stage(setup, stage, repeat):
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        stage(arg)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run(rows=bench_rows, repeat=bench_repeat, seed=0):
+    results = []
+    for n in rows:
+        raw = synthetic_export(n, seed)
+        for name, setup, stage in stages(raw, synthetic_csv(n, seed)):
+            times = pd.Series(time_stage(setup, stage, repeat))
+            results.append({
+                'Rows': n,
+                'Stage': name,
+                'Best (s)': times.min(),
+                'Median (s)': times.median(),
+                'Rows/s': n / times.min(),
+            })
+    return pd.DataFrame(results)
+
+
+def regressions(results, saved, tolerance=regression_tolerance, floor=regression_floor):
+    merged = results.merge(saved, on=['Rows', 'Stage'], suffixes=('', ' saved'))
+    merged['Slowdown'] = merged['Median (s)'] / merged['Median (s) saved'] - 1
+    slower = (merged['Slowdown'] > tolerance) & (merged['Median (s)'] - merged['Median (s) saved'] > floor)
+    return merged.loc[slower, ['Rows', 'Stage', 'Median (s) saved', 'Median (s)', 'Slowdown']]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the cleaning & analytics stages on synthetic data.')
+    parser.add_argument('--rows', type=int, nargs='+', default=list(bench_rows))
+    parser.add_argument('--repeat', type=int, default=bench_repeat)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='save the timings as json')
+    parser.add_argument('--compare', help='json from an earlier --out run (same machine) to check against')
+    parser.add_argument('--tolerance', type=float, default=regression_tolerance)
+    parser.add_argument('--floor', type=float, default=regression_floor, help='seconds')
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.repeat, args.seed)
+    print(results.to_string(index=False, float_format='{:,.4f}'.format))
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results.to_dict(orient='records'), f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            saved = pd.DataFrame(json.load(f))
+        slower = regressions(results, saved, args.tolerance, args.floor)
+        if not slower.empty:
+            print('\nRegressions:')
+            print(slower.to_string(index=False, float_format='{:,.4f}'.format))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+# small named LRU caches shared by every session in the process.
+# caches declared (or put) with spill=True write evicted entries to cache_dir & read them back on a miss
+_caches = {}
+_limits = {}
+_lock = threading.Lock()
+
+cache_dir = '.petri_cache'
+# bump when what gets cached changes shape, so older spilled files are never read back
+cache_version = 5
+disk_cache_max_bytes = 2 * 1024 ** 3
+
+
+def declare_cache(name, max_entries, spill=False):
+    # size & spill setting of a cache, before anything is put in it - so a new process reads back what an
+    # earlier one spilled from the first cache_get
+    with _lock:
+        _limits[name] = (max_entries, spill)
+
+
+def frame_key(df, *params):
+    # cheap key for a result computed from df: its fingerprint (set at upload / load, derived by apply_filters),
+    # never a hash of the frame itself. None - not cacheable - if df has no fingerprint
+    fingerprint = df.attrs.get('fingerprint') if df is not None else None
+    if fingerprint is None:
+        return None
+    return (fingerprint, len(df)) + params
+
+
+def _spill_path(name, key):
+    digest = hashlib.blake2b(repr((cache_version, key)).encode(), digest_size=16).hexdigest()
+    return os.path.join(cache_dir, name, f'{digest}.pkl')
+
+
+def _spill(name, items):
+    for key, value in items:
+        path = _spill_path(name, key)
+        if os.path.exists(path):
+            continue
+        # written next to the final name & renamed, so a reader never sees half a file
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            # a full or read-only disk just means the entry is recomputed next time
+            continue
+    if items:
+        _trim_disk()
+
+
+def _unspill(name, key):
+    path = _spill_path(name, key)
+    try:
+        with open(path, 'rb') as f:
+            # only this app writes cache_dir
+            value = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    # reads count as use for the disk lru
+    os.utime(path)
+    return value
+
+
+def _trim_disk():
+    # least recently used spilled files go first once the directory is over disk_cache_max_bytes
+    files = []
+    for root, _, names in os.walk(cache_dir):
+        for file_name in names:
+            path = os.path.join(root, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= disk_cache_max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def cache_get(name, key):
+    with _lock:
+        cache = _caches.get(name)
+        if cache is not None and key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        max_entries, spill = _limits.get(name, (None, False))
+    if not spill:
+        return None
+    value = _unspill(name, key)
+    if value is not None:
+        cache_put(name, key, value, max_entries, spill)
+    return value
+
+
+def cache_put(name, key, value, max_entries, spill=False):
+    evicted = []
+    with _lock:
+        _limits[name] = (max_entries, spill)
+        cache = _caches.setdefault(name, OrderedDict())
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_entries:
+            evicted.append(cache.popitem(last=False))
+    # pickling happens outside the lock so other sessions aren't held up
+    if spill:
+        _spill(name, evicted)
+
+
+def cached(name, key, compute, max_entries, spill=False):
+    # compute() once per key, for every session; a None key (see frame_key) always computes
+    if key is None:
+        return compute()
+    value = cache_get(name, key)
+    if value is None:
+        value = compute()
+        cache_put(name, key, value, max_entries, spill)
+    return value
@@ -0,0 +1,172 @@
+import io
+import pandas as pd
+from config import date_format, default_site
+from datedim import parse_dates
+from pseudonym import pseudonymize
+from schema import compact_dtypes, record_parsed_memory, sum_parsed_memory
+from xlsx import iter_sheet_chunks, sheet_headers
+
+# csv uploads at least this big are read & cleaned in chunks of ingest_chunksize rows
+stream_ingest_min_bytes = 50 * 1024 * 1024
+ingest_chunksize = 250_000
+
+# export headers are split across 2 rows, so some arrive truncated
+header_renames = {'Person': 'Person Type', 'Access': 'Access Date'}
+# Required Headers - Extra will be handled and removed; Less will be rejected
+min_required_headers = ['Access Date', 'CDSID', 'Person Type',]
+# the only columns parsed out of an export (by cleaned name) & how to read them
+parsed_column_dtypes = {
+    'Person Type': 'category',
+    # dates stay as categories at read time - each distinct date is parsed once in fix_dates
+    'Access Date': 'category',
+    'CDSID': 'object',
+    # optional - exports without it are tagged with the site chosen at upload
+    'Site': 'category',
+    # optional - only kept in the door counts, see count_door_swipes
+    'Reader Description': 'category',
+    'Transaction Type': 'category',
+}
+door_columns = ['Reader Description', 'Transaction Type']
+# the door counts keep the columns the sidebar filters on, so the same filters apply to them
+door_count_keys = ['Site', 'Access Date', 'Day Of Week', 'Person Type'] + door_columns
+
+
+def fix_headers(df):
+    # fix headers - weird split across 2 rows
+    return df.rename(
+        columns=header_renames,
+    )
+
+
+def remove_junk(df):
+    # gets rid of empty rows & that weird split if it's there in future
+    if 'Category Used' in df.columns:  # since empty, this might be removed in future
+        df.drop(columns=['Category Used'], inplace=True)  # empty column
+    return df.dropna()
+
+
+def fix_dates(df):
+    # convert to string to date
+    parsed, codes = parse_dates(df['Access Date'], date_format)
+    df['Access Date'] = parsed.to_numpy()[codes]
+    df['Day Of Week'] = parsed.day_name().to_numpy()[codes]
+    return df
+
+
+def anonymize(df):
+    # keyed hash, not a per-upload code - ids line up across chunks, files, uploads & the store
+    df['anon_id'] = pseudonymize(df['CDSID'])
+    return df.drop(columns=['Last Name', 'First Name', 'CDSID'], errors='ignore')
+
+
+def tag_site(df, site=default_site):
+    if 'Site' not in df:
+        df['Site'] = site
+    return df
+
+
+def count_door_swipes(df):
+    # every swipe per day x reader x granted/denied, counted before count_one_swipe_per_day drops the door columns.
+    # returned next to the one row per person per day frame - never in its attrs, pd.concat can't merge frames there
+    if not any(column in df for column in door_columns):
+        return None
+    keys = [column for column in door_count_keys if column in df]
+    return df.groupby(keys, observed=True).size().rename('Swipes').reset_index()
+
+
+def merge_door_counts(tables):
+    # door counts of chunks / files add up
+    tables = [table for table in tables if table is not None]
+    if not tables:
+        return None
+    df = pd.concat(tables, ignore_index=True)
+    keys = [column for column in door_count_keys if column in df]
+    df = df.groupby(keys, observed=True)['Swipes'].sum().reset_index()
+    for column in ['Site', 'Day Of Week', 'Person Type'] + door_columns:
+        if column in df:
+            df[column] = df[column].astype('category')
+    return df
+
+
+def count_one_swipe_per_day(df):
+    # we only care if person's card was used during a given day. returns (df, door counts)
+    door_counts = count_door_swipes(df)
+    df = df.drop(columns=door_columns, errors='ignore').drop_duplicates(ignore_index=True)
+    return df, door_counts
+
+
+def clean_df(df, site=default_site):
+    df = record_parsed_memory(fix_headers(df))
+    df = remove_junk(df)
+    df = fix_dates(df)
+    df = anonymize(df)
+    df = tag_site(df, site)
+    df, _ = count_one_swipe_per_day(df)
+    df = compact_dtypes(df)
+    return df
+
+
+def clean_chunk(df, site=default_site):
+    # clean_df minus compact_dtypes - CDSIDs never leave the chunk they were read in. returns (df, door counts)
+    df = record_parsed_memory(fix_headers(df))
+    df = remove_junk(df)
+    df = fix_dates(df)
+    df = anonymize(df)
+    df = tag_site(df, site)
+    return count_one_swipe_per_day(df)
+
+
+def finish_clean(partials):
+    # merges (df, door counts) clean_chunk outputs (from chunks or whole files): the final dedup catches days
+    # split across them. returns (df, door counts)
+    frames, door_counts = zip(*partials)
+    df = pd.concat(frames, ignore_index=True)
+    df = df.drop_duplicates(ignore_index=True)
+    # concat drops attrs that differ between frames - kept on the result too, so merging files adds them up
+    df.attrs['parsed_memory'] = sum_parsed_memory(frames)
+    df = compact_dtypes(df)
+    return df, merge_door_counts(door_counts)
+
+
+def has_required_headers(columns):
+    columns = [header_renames.get(column, column) for column in columns]
+    return all(item in columns for item in min_required_headers)
+
+
+def parse_options(columns):
+    # usecols & dtype for the raw header names, so unused columns are never parsed
+    usecols = [column for column in columns if header_renames.get(column, column) in parsed_column_dtypes]
+    dtype = {column: parsed_column_dtypes[header_renames.get(column, column)] for column in usecols}
+    return usecols, dtype
+
+
+def clean_file(name, data, site=default_site):
+    # runs in worker processes - returns (df, door counts, error message) and never touches st
+    extension = name.split('.')[-1]
+    file = io.BytesIO(data)
+    if extension == 'csv':
+        # validate the header row before parsing anything else
+        headers = {None: pd.read_csv(file, nrows=0).columns}
+        file.seek(0)
+    elif extension == 'xlsx':
+        # every sheet with the required headers is ingested
+        headers = sheet_headers(file)
+    else:
+        return None, None, "Incompatiable file. Try .csv or .xlsx"
+
+    sheets = {sheet: parse_options(columns) for sheet, columns in headers.items() if has_required_headers(columns)}
+    if not sheets:
+        return None, None, 'TRY AGAIN! Required data columns are: Access Date, CDSID, Person Type'
+
+    if extension == 'xlsx':
+        # rows are streamed from the read-only worksheets straight into the chunked cleaning
+        chunks = iter_sheet_chunks(file, sheets, ingest_chunksize)
+    elif len(data) >= stream_ingest_min_bytes:
+        usecols, dtype = sheets[None]
+        chunks = pd.read_csv(file, usecols=usecols, dtype=dtype, chunksize=ingest_chunksize)
+    else:
+        usecols, dtype = sheets[None]
+        chunks = [pd.read_csv(file, usecols=usecols, dtype=dtype)]
+    # only one raw chunk is alive at a time; each is reduced to one row per person per day
+    df, door_counts = finish_clean(clean_chunk(chunk, site) for chunk in chunks)
+    return df, door_counts, None
@@ -0,0 +1,64 @@
+import calendar
+import datetime
+from dataclasses import dataclass
+import pandas as pd
+
+date_format = '%d/%m/%Y'
+day_names = list(calendar.day_name)
+
+
+@dataclass(frozen=True)
+class SiteConfig:
+    name: str
+    # headcount the Pct Lab Population charts divide by
+    population: int
+    # (label, start, end) in date order, both ends inclusive, None for an open end. the first phase is the
+    # baseline; days between phases are left out of phase comparisons, as are phases labelled None (exclusions)
+    phases: tuple
+    # (start, end) pairs, both ends inclusive
+    holidays: tuple = ()
+
+    @property
+    def baseline_start_date(self):
+        return self.phases[0][1]
+
+    @property
+    def experiment_start_date(self):
+        # start of the first phase after the baseline
+        return next((start for label, start, _ in self.phases[1:] if label is not None), None)
+
+
+# one entry per lab - exports are tagged with a site at upload (or carry their own Site column)
+sites = {
+    'London': SiteConfig(
+        name='London',
+        population=68,
+        phases=(
+            ('Baseline', None, datetime.date(2023, 2, 7)),
+            # All In Wednesdays
+            ('Post-Experiment', datetime.date(2023, 2, 8), None),
+        ),
+        holidays=((datetime.date(2022, 12, 17), datetime.date(2023, 1, 6)),),
+    ),
+}
+default_site = 'London'
+
+
+def site_config(name=default_site):
+    return sites[name]
+
+
+def site_phases(site):
+    # the labelled phases as a frame, in order - boundary marks every phase that starts after the first
+    phases = pd.DataFrame(
+        [(label, start, end) for label, start, end in site.phases if label is not None],
+        columns=['phase', 'start', 'end'],
+    ).astype({'start': 'datetime64[ns]', 'end': 'datetime64[ns]'})
+    phases['boundary'] = phases.index > 0
+    return phases
+
+
+# the single-lab names the dashboard started with
+experiment_start_date = site_config().experiment_start_date
+lab_population_n = site_config().population
+phases = site_phases(site_config())
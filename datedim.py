@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+
+def phase_dtype(phases):
+    return pd.CategoricalDtype(list(dict.fromkeys(label for label, _, _ in phases if label is not None)), ordered=True)
+
+
+def assign_phases(dates, phases):
+    # (label, start, end) intervals, sorted & non-overlapping -> the label of the interval each date falls in,
+    # NaN in gaps & exclusions. one searchsorted over the interval starts, whatever the number of phases
+    dates = pd.DatetimeIndex(dates)
+    starts = pd.DatetimeIndex([pd.Timestamp.min if start is None else start for _, start, _ in phases])
+    ends = pd.DatetimeIndex([pd.Timestamp.max if end is None else end for _, _, end in phases])
+    if not (starts[1:] > ends[:-1]).all():
+        raise ValueError('phases must be in date order and must not overlap')
+    labels = pd.Categorical([label for label, _, _ in phases], dtype=phase_dtype(phases))
+    i = starts.searchsorted(dates, side='right') - 1
+    inside = (i >= 0) & (dates <= ends[np.maximum(i, 0)])
+    codes = np.where(inside, labels.codes[np.maximum(i, 0)], -1)
+    return pd.Categorical.from_codes(codes, dtype=labels.dtype)
+
+
+def build_date_dim(dates, phases=None):
+    # one row per unique date - calendar labels are formatted a few hundred times, not once per swipe
+    dates = pd.Index(dates)
+    ts = pd.DatetimeIndex(pd.to_datetime(dates))
+    dim = pd.DataFrame({
+        'Day Of Week': ts.day_name(),
+        'Quarter': ts.to_period('Q').strftime('%YQ%q'),
+        'Year-Week': ts.strftime('%Y-%U'),
+        'ISO Year-Week': ts.strftime('%G-%V'),
+    }, index=dates)
+    if phases is not None:
+        dim['Phase'] = assign_phases(ts, phases)
+    return dim
+
+
+def add_date_columns(df, columns, phases=None, date_col='Access Date'):
+    codes, uniques = pd.factorize(df[date_col])
+    dim = build_date_dim(uniques, phases)
+    for column in columns:
+        # .array keeps categoricals (Phase) categorical
+        df[column] = dim[column].array.take(codes)
+    return df
+
+
+def parse_dates(values, date_format):
+    # parse each distinct date string once, then broadcast back onto the rows
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(np.asarray(uniques), format=date_format)
+    return parsed, codes
@@ -0,0 +1,48 @@
+import gzip
+import io
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# the clean data download, encoded a chunk of rows at a time - the whole CSV text is never built as one string.
+# the finished file is still held in memory as bytes: streamlit reads a download's data fully before serving it
+export_chunk_rows = 100_000
+
+
+def iter_csv_chunks(df, chunk_rows=export_chunk_rows):
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(header=start == 0)
+
+
+def write_csv(df, f):
+    for chunk in iter_csv_chunks(df):
+        f.write(chunk.encode('utf-8'))
+
+
+def write_csv_gzip(df, f):
+    with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+        write_csv(df, gz)
+
+
+def write_parquet(df, f):
+    # one row group per chunk
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(f, schema) as writer:
+        for start in range(0, len(df), export_chunk_rows):
+            chunk = df.iloc[start:start + export_chunk_rows]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+# label -> (file extension, mime type, writer)
+export_formats = {
+    'CSV (gzip)': ('csv.gz', 'application/gzip', write_csv_gzip),
+    'CSV': ('csv', 'text/csv', write_csv),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet', write_parquet),
+}
+
+
+def export_file(df, export_format):
+    # df in export_format, as bytes
+    _, _, writer = export_formats[export_format]
+    f = io.BytesIO()
+    writer(df, f)
+    return f.getvalue()
@@ -0,0 +1,83 @@
+import datetime
+import hashlib
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from cache import cache_get, cache_put
+from config import sites
+
+weekend_days = ('Saturday', 'Sunday')
+# (start, end) pairs apply to every row, (start, end, site) only to that site's rows; both ends inclusive
+default_holidays = tuple(
+    (start, end, site.name) for site in sites.values() for start, end in site.holidays
+)
+filter_cache_max_entries = 32
+
+
+@dataclass(frozen=True)
+class FilterSpec:
+    remove_weekends: bool = False
+    holidays: tuple = ()
+    # keep only dates before this (baseline only views)
+    before_date: datetime.date = None
+    # None keeps every person type
+    person_types: frozenset = None
+    # None keeps every site
+    sites: frozenset = None
+
+
+def spec_key(spec):
+    # spec with its sets sorted - repr of a frozenset depends on PYTHONHASHSEED, & fingerprints derived
+    # from it have to match across processes for the spilled caches
+    return (
+        spec.remove_weekends,
+        spec.holidays,
+        spec.before_date,
+        None if spec.person_types is None else tuple(sorted(spec.person_types)),
+        None if spec.sites is None else tuple(sorted(spec.sites)),
+    )
+
+
+def filter_mask(df, spec):
+    # every rule is and-ed into one boolean mask so the frame is only copied once
+    mask = np.ones(len(df), dtype=bool)
+    if spec.remove_weekends:
+        mask &= ~df['Day Of Week'].isin(weekend_days).to_numpy()
+    dates = df['Access Date']
+    for start, end, *site in spec.holidays:
+        holiday = (dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))
+        if site and 'Site' in df:
+            holiday &= df['Site'] == site[0]
+        mask &= ~holiday.to_numpy()
+    if spec.before_date is not None:
+        mask &= (dates < pd.Timestamp(spec.before_date)).to_numpy()
+    if spec.person_types is not None:
+        mask &= df['Person Type'].isin(spec.person_types).to_numpy()
+    if spec.sites is not None:
+        mask &= df['Site'].isin(spec.sites).to_numpy()
+    return mask
+
+
+def apply_filters(df, spec):
+    if df is None:
+        return df
+    # masks are memoized per (dataset, spec) so flipping a sidebar option back is a lookup
+    fingerprint = df.attrs.get('fingerprint')
+    key = (fingerprint, len(df), spec)
+    mask = cache_get('filter_mask', key) if fingerprint is not None else None
+    if mask is None:
+        mask = filter_mask(df, spec)
+        if fingerprint is not None:
+            cache_put('filter_mask', key, mask, filter_cache_max_entries)
+    if mask.all():
+        return df
+    df = df[mask]
+    if fingerprint is not None:
+        # the subset is a dataset of its own as far as later memoization goes
+        subset = (fingerprint, len(mask), spec_key(spec))
+        df.attrs['fingerprint'] = hashlib.blake2b(repr(subset).encode(), digest_size=16).hexdigest()
+    return df
+
+
+def format_date_range(start, end):
+    return f'{start:%a, %d %b %Y} - {end:%a, %d %b %Y}'
@@ -0,0 +1,87 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+
+# wall time, rows & process memory per pipeline stage, for the current script run.
+# streamlit runs each session's script in its own thread, so records are kept per thread
+_local = threading.local()
+
+
+def reset_stages():
+    _local.records = []
+    _local.depth = 0
+    _local.started = time.perf_counter()
+
+
+def stage_records():
+    return list(getattr(_local, 'records', []))
+
+
+def _rss_bytes():
+    # resident memory of this process - linux only, None elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _rows(result):
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    return len(result) if isinstance(result, pd.DataFrame) else None
+
+
+@contextmanager
+def stage(name, rows=None):
+    # the yielded record can be updated inside the block, e.g. record['Rows'] = len(df)
+    if not hasattr(_local, 'records'):
+        reset_stages()
+    record = {'Stage': name, 'Depth': _local.depth, 'Rows': rows}
+    rss_before = _rss_bytes()
+    _local.depth += 1
+    start = time.perf_counter()
+    record['Start (s)'] = start - _local.started
+    try:
+        yield record
+    finally:
+        record['Seconds'] = time.perf_counter() - start
+        _local.depth -= 1
+        rss_after = _rss_bytes()
+        # the whole server process, not this stage: other sessions & the report pool allocate meanwhile, and
+        # forkserver workers (parse & clean) aren't in it at all. a rough signal, labelled as such
+        record['Process RSS Delta (MB)'] = (
+            (rss_after - rss_before) / 2 ** 20 if rss_before is not None and rss_after is not None else None
+        )
+        _local.records.append(record)
+
+
+def timed(name):
+    # stage() as a decorator - rows are taken from a returned frame (or the first item of a returned tuple)
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name) as record:
+                result = func(*args, **kwargs)
+                record['Rows'] = _rows(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def stage_report(records):
+    # one row per stage call, in the order they started; nested stages are indented
+    columns = ['Stage', 'Depth', 'Start (s)', 'Seconds', 'Rows', 'Process RSS Delta (MB)']
+    report = pd.DataFrame(records, columns=columns).sort_values('Start (s)', ignore_index=True)
+    report['Stage'] = ['· ' * depth + name for name, depth in zip(report['Stage'], report['Depth'])]
+    return report.drop(columns=['Depth'])
+
+
+def stages_json(records):
+    records = sorted(records, key=lambda record: record['Start (s)'])
+    return json.dumps({'stages': records, 'total_seconds': sum(
+        record['Seconds'] for record in records if record['Depth'] == 0)}, indent=2)
@@ -1,110 +1,130 @@
 import altair as alt
 import pandas as pd
 from dateutil.relativedelta import relativedelta
-import numpy as np
 from utils import *
+from analytics import baseline_report, compare_column, comparison_report, sites_report
 from PIL import Image
 
 def print_chart_df(df):
     with st.expander("See chart data"):
         st.dataframe(df)
 
+def altair_chart(chart, **kwargs):
+    # st.altair_chart serializes the chart & its data to vega-lite json, usually the slow part of drawing it
+    with stage('altair chart'):
+        st.altair_chart(chart, **kwargs)
+
 def print_pretty_df(df):
     # st.table(df.style.format('{:7,.2f}'))
     st.table(df)
 
-def print_summary_stats(df, dataframe=False):
+def print_summary_stats(stats, dataframe=False):
+    # stats is a precomputed describe() frame
     if dataframe:
-        st.dataframe(df.describe().style.format('{:7,.2f}'))
+        st.dataframe(stats.style.format('{:7,.2f}'))
     else:
-        st.table(df.describe().style.format('{:7,.2f}'))
+        st.table(stats.style.format('{:7,.2f}'))
+
+
+def boxplot_chart(box_df, value_title, value_axis=alt.Axis(), group=None, group_axis=alt.Axis(), group_sort=None, color=None, horizontal=True):
+    # boxplot layered from analytics.boxplot_stats output - quartiles & outliers only, never every row
+    value, value2, group_channel = ('x', 'x2', 'y') if horizontal else ('y', 'y2', 'x')
+    Value, Value2, Group = (alt.X, alt.X2, alt.Y) if horizontal else (alt.Y, alt.Y2, alt.X)
+    groups = {group_channel: Group(group, title=None, axis=group_axis, sort=group_sort)} if group else {}
+    colors = {'color': color} if color else {}
+    boxes = alt.Chart().transform_filter(alt.datum.kind == 'box')
+    outliers = alt.Chart().transform_filter(alt.datum.kind == 'outlier')
+    return alt.layer(
+        boxes.mark_rule().encode(
+            **{value: Value('lower:Q', title=value_title, axis=value_axis), value2: Value2('upper:Q')}, **groups),
+        boxes.mark_bar(size=14).encode(
+            **{value: Value('q1:Q', title=value_title), value2: Value2('q3:Q')}, **groups, **colors),
+        boxes.mark_tick(color='white', size=14).encode(
+            **{value: Value('median:Q', title=value_title)}, **groups),
+        outliers.mark_point().encode(
+            **{value: Value('value:Q', title=value_title)}, **groups, **colors),
+        data=box_df,
+    )
 
-def unique_swipes_per_day(df, combined=False):
-    if combined:
-        return df.groupby(['Access Date', 'Source']).size().rename('Swipe Count').reset_index(level=0)
-    else:
-        return df.groupby('Access Date').size().rename('Swipe Count').reset_index(level=0)
+
+def compare_sort(report, compare):
+    # phases sort in phase table order, quarters as text
+    return report['phases']['phase'].tolist() if compare == 'Phase' else 'ascending'
 
 
-def unique_swipes_line_chart(df, compare_option="Experiment", tab="Baseline", pct=False, show_data=False):
+def unique_swipes_line_chart(report, name='swipes', compare_option="Experiment", tab="Baseline", pct=False, show_data=False):
     # timeseries - unique swipes per day
+    # report[name] is the per day frame, report[name + '_box'] / report[name + '_line'] its chart aggregates
+    df = report[name]
+    site_name = report['overview']['Site'][0]
+    lab_population_n = report['overview']['Lab Population'][0]
 
     if pct:
-        df['Pct Lab Population'] = df['Swipe Count'] / lab_population_n
         st.markdown(f"""
                         ### Percent of Lab Employee Population Sensed 
-                        *Only looking as Employees of London Lab / Excludes Contractors & Temp 
+                        *Only looking as Employees of {site_name} Lab / Excludes Contractors & Temp 
                         (total employee n={lab_population_n})*
                         """)
-        summaryX = alt.X("Pct Lab Population:Q", title="Pct Lab Employee Population", axis=alt.Axis(format='.0%'))
-        linesY = alt.Y("Pct Lab Population:Q", title="Pct Lab Employee Population", axis=alt.Axis(format='.0%'))
+        summary_title, summary_axis = "Pct Lab Employee Population", alt.Axis(format='.0%')
+        value = "Pct Lab Population"
     else:
         st.markdown("""
                     ### Unique swipes sensed (Door Agnostic Counts) 
                     *Something about this is expected / surprising*
                     """)
-        summaryX = alt.X("Swipe Count:Q", title="Swipe Count")
-        linesY = "Swipe Count"
+        summary_title, summary_axis = "Swipe Count", alt.Axis()
+        value = "Swipe Count"
 
-    if compare_option == "Experiment":
-        compare = "Source"
-    else:
-        compare = "Quarter"
+    compare = compare_column(compare_option)
 
     if tab == "Comparison":
-        df['Source'] = 'Baseline'
-        df.loc[df['Access Date'] >= experiment_start_date, 'Source'] = 'Post-Experiment'
-        summary = (
-            alt.Chart(df)
-            .mark_boxplot()
-            .encode(
-                x=summaryX,
-                # y="Quarter",
-                # color="Quarter",
-                y=compare,
-                color=compare,
-            ).properties(
-                height=300
-            )
+        summary = boxplot_chart(
+            report[name + '_box'], summary_title, summary_axis,
+            group=f'{compare}:N', group_sort=compare_sort(report, compare),
+            color=alt.Color(f'{compare}:N', sort=compare_sort(report, compare)),
+        ).properties(
+            height=300
         )
     else:
-        summary = (
-            alt.Chart(df)
-            .mark_boxplot()
-            .encode(
-                x=summaryX,
-            ).properties(
-                height=150
-            )
+        summary = boxplot_chart(
+            report[name + '_box'], summary_title, summary_axis,
+        ).properties(
+            height=150
         )
+    # the daily values & their moving averages (analytics.add_swipe_rolling), one line each
+    series = [value, f'{value} 7d Avg', f'{value} 28d Avg']
     lines = (
-        alt.Chart(df)
+        alt.Chart(report[name + '_line'])
+        .transform_fold(series, as_=['Series', 'Value'])
         .mark_line()
         .encode(
             x=alt.X("Access Date:T", title="Access Date", axis=alt.Axis(labelAngle=45)),
-            y=linesY,
+            y=alt.Y("Value:Q", title=summary_title, axis=summary_axis),
+            color=alt.Color("Series:N", sort=series, title=None),
+            opacity=alt.condition(alt.datum.Series == value, alt.value(.4), alt.value(1)),
+            tooltip=["Access Date:T", "Series:N", "Value:Q", f"{value} WoW Change:Q"],
         )
     ).interactive()
 
     if tab == "Comparison":
-        st.altair_chart(summary, theme=None, use_container_width=True)
-        print_summary_stats(df.groupby(compare))
+        altair_chart(summary, theme=None, use_container_width=True)
+        print_summary_stats(report[name + '_summary'])
     else:
         col1, col2 = st.columns(2)
         with col1:
-            st.altair_chart(summary, theme=None, use_container_width=True)
+            altair_chart(summary, theme=None, use_container_width=True)
         with col2:
-            print_summary_stats(df)
+            print_summary_stats(report[name + '_summary'])
 
     if tab == "Comparison":
-        rule = alt.Chart(phases).mark_rule(
+        rule = alt.Chart(report['phases']).mark_rule(
             color="orange",
             strokeWidth=3
         ).encode(
             x='start:T'
-        ).transform_filter(alt.datum.phase == "Post-Experiment")
+        ).transform_filter(alt.datum.boundary)
 
-        text = alt.Chart(phases).mark_text(
+        text = alt.Chart(report['phases']).mark_text(
             align='left',
             baseline='middle',
             dx=7,
@@ -116,27 +136,27 @@ def unique_swipes_line_chart(df, compare_option="Experiment", tab="Baseline", pc
             text='phase',
             color=alt.value('#000000')
         )
-        # st.altair_chart(lines + comp_lines + rule + text, theme=None, use_container_width=True)
-        st.altair_chart(lines + rule + text, theme=None, use_container_width=True)
+        # altair_chart(lines + comp_lines + rule + text, theme=None, use_container_width=True)
+        altair_chart(lines + rule + text, theme=None, use_container_width=True)
     else:
 
-        st.altair_chart(lines, theme=None, use_container_width=True)
+        altair_chart(lines, theme=None, use_container_width=True)
 
     if show_data:
         print_chart_df(df)
 
 
-def counts_over_time_bar_chart(df):
+def counts_over_time_bar_chart(report):
 
-    bar = alt.Chart(df).mark_bar().encode(
+    bar = alt.Chart(report['swipes_line']).mark_bar().encode(
         x=alt.X("Access Date:T", title="Access Date", axis=alt.Axis(labelAngle=45)),
         y='Swipe Count:Q'
     )
 
-    st.altair_chart(bar, theme=None, use_container_width=True)
-    print_chart_df(df)
+    altair_chart(bar, theme=None, use_container_width=True)
+    print_chart_df(report['swipes'])
 
-def boxplot_by_day(df, compare_option="Experiment", tab="Baseline"):
+def boxplot_by_day(report, compare_option="Experiment", tab="Baseline"):
     if tab == 'Baseline':
         st.markdown("""
                     ### Midweek is the busiest 
@@ -144,69 +164,55 @@ def boxplot_by_day(df, compare_option="Experiment", tab="Baseline"):
                     """)
 
     # SPLIT BY DAY OF WEEK
-    df['Day Of Week'] = pd.to_datetime(df['Access Date'], format='%Y-%m-%d')
-    df['Day Of Week'] = df['Day Of Week'].dt.day_name()
-
     if tab == 'Comparison':
-        if compare_option == 'Experiment':
-            compare = 'Source'
-        elif compare_option == 'Quarter':
-            compare = 'Quarter'
-
-        df['Source'] = 'Baseline'
-        df.loc[df['Access Date'] >= experiment_start_date, 'Source'] = 'Post-Experiment'
-
-        chart = alt.Chart(df).mark_boxplot().encode(
-            # alt.Column('Day Of Week'),
-            x=alt.X(compare, title=None, axis=alt.Axis(labels=False, ticks=False), scale=alt.Scale(padding=1)),
-            y='Swipe Count',
-            color=compare,
+        compare = compare_column(compare_option)
+
+        chart = boxplot_chart(
+            report['day_of_week_box'], 'Swipe Count',
+            group=f'{compare}:N', group_axis=alt.Axis(labels=False, ticks=False), group_sort=compare_sort(report, compare),
+            color=alt.Color(f'{compare}:N', sort=compare_sort(report, compare)), horizontal=False,
         ).facet(
             column=alt.Column('Day Of Week:O', sort=day_names)
-        ).interactive()
-        st.altair_chart(chart, theme=None)
+        )
+        altair_chart(chart, theme=None)
 
     else:
         # BOXPLOTS - group by day of week
-        chart = alt.Chart(df).mark_boxplot().encode(
-            x=alt.X('Day Of Week', sort=day_names, axis=alt.Axis(labelAngle=0)),
-            y='Swipe Count',
-            color=alt.Color('Day Of Week', sort=day_names),
-        ).interactive()
-        st.altair_chart(chart, theme=None, use_container_width=True)
-        # ensure describe outputs correct day order
-        filtered_days = [day for day in day_names if day in df['Day Of Week'].unique()]
-        category_day = pd.api.types.CategoricalDtype(categories=filtered_days, ordered=True)
-        df['Day Of Week'] = df['Day Of Week'].astype(category_day)
+        chart = boxplot_chart(
+            report['day_of_week_box'], 'Swipe Count',
+            group='Day Of Week:N', group_axis=alt.Axis(labelAngle=0), group_sort=day_names,
+            color=alt.Color('Day Of Week:N', sort=day_names), horizontal=False,
+        )
+        altair_chart(chart, theme=None, use_container_width=True)
 
 
-def timeseries_by_day(df, compare_option="Experiment", tab="Baseline"):
+def timeseries_by_day(report, tab="Baseline"):
     # if tab == "Baseline":
         # st.markdown("""
         #             ### Thursday & Tuesday consistently most crowded
         #             *Something about this is expected / surprising*
         #             """)
-    if compare_option == 'Experiment':
-        compare = "Source"
-    else:
-        compare = "Quarter"
     # TIMESERIES - group by day of week
-    chart = alt.Chart(df).mark_line().encode(
+    # faint daily counts, & each weekday's average over its last 4 weeks
+    days = alt.Chart(report['day_of_week_line']).encode(
         x='Access Date',
-        y='Swipe Count',
         color=alt.Color('Day Of Week', sort=['Monday'])
+    )
+    chart = (
+        days.mark_line(opacity=.3).encode(y='Swipe Count')
+        + days.mark_line().encode(y=alt.Y('Swipe Count 28d Avg', title='Swipe Count'))
     ).interactive()
 
     if tab == 'Comparison':
 
-        rule = alt.Chart(phases).mark_rule(
+        rule = alt.Chart(report['phases']).mark_rule(
             color="orange",
             strokeWidth=3
         ).encode(
             x='start:T'
-        ).transform_filter(alt.datum.phase == "Post-Experiment")
+        ).transform_filter(alt.datum.boundary)
 
-        text = alt.Chart(phases).mark_text(
+        text = alt.Chart(report['phases']).mark_text(
             align='left',
             baseline='middle',
             dx=7,
@@ -218,25 +224,28 @@ def timeseries_by_day(df, compare_option="Experiment", tab="Baseline"):
             text='phase',
             color=alt.value('#000000')
         )
-        st.altair_chart(chart + rule + text, theme=None, use_container_width=True)
-        print_summary_stats(df.groupby(['Day Of Week', compare])['Swipe Count'], dataframe=True)
-        print_chart_df(df)
+        altair_chart(chart + rule + text, theme=None, use_container_width=True)
+        print_summary_stats(report['day_of_week_summary'], dataframe=True)
+        print_chart_df(report['swipes'])
     else:
-        st.altair_chart(chart, theme=None, use_container_width=True)
-        print_summary_stats(df.groupby('Day Of Week')['Swipe Count'])
-        print_chart_df(df)
+        altair_chart(chart, theme=None, use_container_width=True)
+        print_summary_stats(report['day_of_week_summary'])
+        print_chart_df(report['swipes'])
 
 def extract_variables(df, file_type='Baseline'):
     min_date_value = df['Access Date'].min()
     max_date_value = df['Access Date'].max()
-    person_types = df['Person Type'].unique()
+    person_types = df['Person Type'].unique().tolist()
 
     return min_date_value, max_date_value, person_types
 
 
-def baseline_tab(raw_df):
+def baseline_tab(report, sites=None):
     # constant variables based on data
-    min_date_value, max_date_value, person_types = extract_variables(raw_df)
+    min_date_value = report['overview']['First Date'][0]
+    experiment_start_date = report['overview']['Experiment Start'][0]
+    site_name = report['overview']['Site'][0]
+    lab_population_n = report['overview']['Lab Population'][0]
 
     st.title(f"Baseline Door Data!")  # add a title
     st.subheader(f"Baseline Dates: {min_date_value:%a, %d %b %Y} - {experiment_start_date + relativedelta(days=-1):%a, %d %b %Y}")
@@ -245,9 +254,13 @@ def baseline_tab(raw_df):
                  This Streamlit app has been purpose built for the London lab, Project Petri “All In Wednesdays” experiment. 
                  It is solely accessible by uploading the London lab entry data. 
                
-               **Baseline Population of London Lab: {lab_population_n} people**
+               **Baseline Population of {site_name} Lab: {lab_population_n} people**
      """)
 
+    if sites is not None and len(sites['sites']['Site'].unique()) > 1:
+        with st.expander("All sites"):
+            st.dataframe(sites['sites'])
+
     st.markdown("""
                  ### Disclaimer: door swipe data undercounts. 
                  Daily entries into the lab have only been counted once per day and solely from the external lab doors. 
@@ -264,38 +277,53 @@ def baseline_tab(raw_df):
                     Description - data cleaned. removed some data intentionally .
                     """)
 
-    # Employee only data for some graphs
-    employee_df = include_employees_only_data(raw_df)
-    employee_only_swipe_cnts_df = unique_swipes_per_day(employee_df)
-
-    # aggregate unique swipes by day
-    swipe_cnts_df = unique_swipes_per_day(raw_df)
+    # everything below is precomputed by analytics.baseline_report
 
     # GRAPHS
 
     # OVERVIEW
-    unique_swipes_line_chart(swipe_cnts_df)
-    counts_over_time_bar_chart(swipe_cnts_df)
-    unique_swipes_line_chart(employee_only_swipe_cnts_df, pct=True, show_data=True)
+    unique_swipes_line_chart(report)
+    counts_over_time_bar_chart(report)
+    # Employee only data for some graphs
+    unique_swipes_line_chart(report, 'employee_swipes', pct=True, show_data=True)
 
     # SPLIT BY DAY OF WEEK
-    boxplot_by_day(swipe_cnts_df)
-    timeseries_by_day(swipe_cnts_df)
+    boxplot_by_day(report)
+    timeseries_by_day(report)
 
-    swiper_patterns(raw_df)
+    swiper_patterns(report)
+    door_utilization(report)
 
-def add_quarters(df):
-    df['Quarter'] = pd.to_datetime(df['Access Date'], format='%Y-%m-%d')
-    df['Quarter'] = df['Quarter'].dt.to_period('Q').dt.strftime('%YQ%q')
-    return df
+def door_utilization(report):
+    # only exports with a Reader Description column have door counts
+    summary = report['door_summary']
+    if summary.empty:
+        return
 
-def comparison_tab(raw_df, compare_option="Experiment", debug=False):
+    st.markdown("""
+                ### Door Utilization
+                *Every swipe per reader, before counting people once per day*
+                """)
+
+    # one bar per reader, stacked by transaction type - already summed in analytics.door_utilization
+    chart = alt.Chart(summary).mark_bar().encode(
+        x=alt.X('Swipes:Q', title='Swipes'),
+        y=alt.Y('Reader Description:N', sort='-x', title=None),
+        color='Transaction Type:N',
+        tooltip=['Reader Description', 'Transaction Type', 'Swipes:Q', alt.Tooltip('Share Of Swipes:Q', format='.1%')],
+    )
+    altair_chart(chart, theme=None, use_container_width=True)
+    print_pretty_df(summary)
+
+def comparison_tab(report, compare_option="Experiment", debug=False):
     # DATES FOR HEADER
-    # min_baseline_date, max_baseline_date , person_types = extract_variables(df)
     if debug:
         st.header('DEBUG MODE')
 
-    min_date_value, max_date_value, person_types = extract_variables(raw_df)
+    max_date_value = report['overview']['Last Date'][0]
+    experiment_start_date = report['overview']['Experiment Start'][0]
+    site_name = report['overview']['Site'][0]
+    lab_population_n = report['overview']['Lab Population'][0]
 
     st.title(f"Post Experiment Comparison")  # add a title
     st.subheader(
@@ -303,42 +331,23 @@ def comparison_tab(raw_df, compare_option="Experiment", debug=False):
     st.markdown(f"""
                      This view allows for comparison of Door Data patterns post experiment start date with Baseline
 
-                   **Baseline Population of London Lab: {lab_population_n} people**
+                   **Baseline Population of {site_name} Lab: {lab_population_n} people**
          """)
-    # Filter options - person type, dates, weekend
-    # df = filter_options(df, person_types, tab="comparison")
-
-    # aggregate unique swipes by day
-    swipe_cnts_df = unique_swipes_per_day(raw_df)
-    swipe_cnts_df = add_quarters(swipe_cnts_df)
-
-    # Employee only data for some graphs
-    employee_df = include_employees_only_data(raw_df)
-    employee_only_swipe_cnts_df = unique_swipes_per_day(employee_df)
-    employee_only_swipe_cnts_df = add_quarters(employee_only_swipe_cnts_df)
-
-    # #
-    if debug:
-        # Randomly add or subtract up to 5 swipes per day
-        np.random.seed(42)
-        swipe_cnts_df['Swipe Count'] = swipe_cnts_df['Swipe Count'] + np.random.randint(-5, 5)
-        employee_only_swipe_cnts_df['Swipe Count'] = employee_only_swipe_cnts_df['Swipe Count'] + np.random.randint(-5, 5)
-
-    df['Source'] = 'Baseline'
-    df.loc[df['Access Date'] >= experiment_start_date, 'Source'] = 'Post-Experiment'
-
+    # everything below is precomputed by analytics.comparison_report
 
     # GRAPHS
     # OVERVIEW
-    unique_swipes_line_chart(swipe_cnts_df, compare_option, tab="Comparison", show_data=True)
-    unique_swipes_line_chart(employee_only_swipe_cnts_df, compare_option,pct=True, tab="Comparison", show_data=True)
+    unique_swipes_line_chart(report, compare_option=compare_option, tab="Comparison", show_data=True)
+    unique_swipes_line_chart(report, 'employee_swipes', compare_option, pct=True, tab="Comparison", show_data=True)
 
     # # SPLIT BY DAY OF WEEK
-    boxplot_by_day(swipe_cnts_df, compare_option, tab="Comparison")
-    timeseries_by_day(swipe_cnts_df, compare_option, tab="Comparison")
+    boxplot_by_day(report, compare_option, tab="Comparison")
+    timeseries_by_day(report, tab="Comparison")
+
+    phase_significance(report)
+    retention(report)
 
-    raw_df = add_quarters(raw_df)
-    # swiper_patterns(raw_df, compare_option, tab="Comparison")
+    # swiper_patterns(report, compare_option, tab="Comparison")
 
     # HUNCHES
     # more people will come on wednesdays
@@ -348,20 +357,59 @@ def comparison_tab(raw_df, compare_option="Experiment", debug=False):
     # combo of both?
 
 
-def swiper_patterns(df, compare_option="Experiment", tab="Baseline"):
+def phase_significance(report):
+    # change in mean daily swipes vs the baseline phase, from stats.phase_tests
+    tests = report['day_of_week_tests']
+    if tests.empty:
+        return
+    st.markdown("""
+                ### Is the change more than day to day noise?
+                *Change in mean daily swipes vs the baseline, with a 95% bootstrap interval. 
+                p-values are from a permutation test - small ones mean the change is unlikely to be chance*
+                """)
 
-    # SPLIT BY DAY OF WEEK
-    df['Day Of Week'] = pd.to_datetime(df['Access Date'], format='%Y-%m-%d')
-    df['Day Of Week'] = df['Day Of Week'].dt.day_name()
-    df['Year-Week'] = pd.to_datetime(df['Access Date']).dt.strftime('%Y-%U')
+    day = alt.Y('Day Of Week:N', sort=day_names, title=None)
+    chart = alt.layer(
+        alt.Chart().mark_rule(color='grey', strokeDash=[4, 4]).encode(x=alt.datum(0)),
+        alt.Chart().mark_rule(strokeWidth=2).encode(
+            x=alt.X('CI Low:Q', title='Change in Swipes Per Day'), x2='CI High:Q', y=day),
+        alt.Chart().mark_point(filled=True, size=60).encode(
+            x='Difference:Q', y=day, tooltip=['Day Of Week', 'Phase', 'Difference', 'CI Low', 'CI High', 'p-value']),
+        data=tests,
+    ).facet(
+        column=alt.Column('Phase:N', sort=compare_sort(report, 'Phase'), title=None)
+    )
+    altair_chart(chart, theme=None)
+    print_pretty_df(report['phase_tests'].style.format(precision=2).format({'p-value': '{:.3f}'}))
+    print_chart_df(tests)
 
-    df['Source'] = 'Baseline'
-    df.loc[df['Access Date'] >= experiment_start_date, 'Source'] = 'Post-Experiment'
 
-    if compare_option == "Experiment":
-        compare = "Source"
-    else:
-        compare = "Quarter"
+def retention(report):
+    # analytics.comparison_report 'retention' - one row per cohort, a share column per phase
+    df = report['retention']
+    if len(df.columns) < 4:
+        return
+    st.markdown("""
+                ### Do people keep coming?
+                *People grouped by the phase they first came in, & the share of each group that came in during every phase*
+                """)
+
+    phases = list(df.columns[2:])
+    chart = alt.Chart(df).transform_fold(phases, as_=['Phase', 'Share']).mark_rect().encode(
+        x=alt.X('Phase:N', sort=phases),
+        y=alt.Y('Cohort:N', sort=phases),
+        color=alt.Color('Share:Q', scale=alt.Scale(domain=[0, 1]), legend=alt.Legend(format='.0%')),
+        tooltip=['Cohort:N', 'People:Q', 'Phase:N', alt.Tooltip('Share:Q', format='.1%')],
+    )
+    altair_chart(chart, theme=None, use_container_width=True)
+    print_pretty_df(df.style.format({phase: '{:.1%}' for phase in phases}))
+
+
+def swiper_patterns(report, compare_option="Experiment", tab="Baseline"):
+    # people per Year-Week & visit count, already aggregated (see analytics.repeat_visits_by_week)
+    df2 = report['repeat_visits_by_week']
+    print_df = report['repeat_visits_distribution']
+    compare = compare_column(compare_option)
 
     # how many days a week is the same card used?
 
@@ -374,21 +422,19 @@ def swiper_patterns(df, compare_option="Experiment", tab="Baseline"):
                 *Something about this is expected / surprising*
                 """)
 
-        df2 = df.groupby(['anon_id', 'Year-Week']).size().to_frame(name='Repeat Visits Per Week').reset_index().copy()
-        chart = alt.Chart(df2).mark_bar().encode(
-            y=alt.Y('count():Q', title="Percent", axis=alt.Axis(labelAngle=0, format='.0%'), stack="normalize"),
+        chart = alt.Chart(print_df).mark_bar().encode(
+            y=alt.Y('Total Times Card Swiped X Times a Week:Q', title="Percent", axis=alt.Axis(labelAngle=0, format='.0%'), stack="normalize"),
             color = 'Repeat Visits Per Week:O'
         ).properties(
                 # height=500
         ).interactive()
     else:
-        st.dataframe(df)
-        df2 = df.groupby(['anon_id', 'Year-Week']).size().to_frame(name='Repeat Visits Per Week').reset_index().copy()
+        st.dataframe(df2)
         chart = not not alt.Chart(df2).mark_bar().encode(
             # x="Quarter",
             # x=compare,
             x=compare,
-            y=alt.Y('count():Q', title="Percent", axis=alt.Axis(labelAngle=0, format='.0%'), stack="normalize"),
+            y=alt.Y('People:Q', title="Percent", axis=alt.Axis(labelAngle=0, format='.0%'), stack="normalize"),
             color='Repeat Visits Per Week:O'
         ).properties(
             # height=500
@@ -398,20 +444,25 @@ def swiper_patterns(df, compare_option="Experiment", tab="Baseline"):
     if tab == 'Baseline':
         col1, col2 = st.columns(2)
 
-        print_df = df2.groupby(['Repeat Visits Per Week']).size().to_frame(
-            name='Total Times Card Swiped X Times a Week')
-        total_visits = print_df['Total Times Card Swiped X Times a Week'].sum()
-        print_df['Percent'] = print_df['Total Times Card Swiped X Times a Week'] / total_visits
-        print_df.index.name = 'Repeat Visits Per Week'
-        print_df.reset_index(inplace=True)
-
         with col1:
             print_pretty_df(print_df)
 
         with col2:
-            st.altair_chart(chart, theme=None, use_container_width=True)
+            altair_chart(chart, theme=None, use_container_width=True)
     else:
-        st.altair_chart(chart, theme=None, use_container_width=True)
+        altair_chart(chart, theme=None, use_container_width=True)
+
+    if tab == 'Baseline':
+        st.markdown("""
+                ### How many weeks in a row do people come in?
+                *Longest run of consecutive weeks with at least one visit, per person*
+                """)
+        streaks = alt.Chart(report['streaks']).mark_bar().encode(
+            x=alt.X('Longest Streak (Weeks):O', axis=alt.Axis(labelAngle=0)),
+            y=alt.Y('Percent:Q', axis=alt.Axis(format='.0%')),
+            tooltip=['Longest Streak (Weeks)', 'People', alt.Tooltip('Percent:Q', format='.1%')],
+        )
+        altair_chart(streaks, theme=None, use_container_width=True)
     # chart = alt.Chart(df2).mark_boxplot().encode(
     #     x=alt.X('Repeat Visits:O', axis=alt.Axis(labelAngle=0)),
     #     y=alt.Y("datum['Year-Week'].mean()"),
@@ -421,18 +472,18 @@ def swiper_patterns(df, compare_option="Experiment", tab="Baseline"):
     # #     y='Swipe Count',
     # #     color=alt.Color('Day Of Week', sort=day_names),
     # # ).interactive()
-    # st.altair_chart(chart, theme=None, use_container_width=True)
+    # altair_chart(chart, theme=None, use_container_width=True)
     # #
     # #
     # # # per card, look at avg times in studio per week (across baseline)
     #
     chart2 = alt.Chart(df2).mark_line().encode(
         x=alt.X('Year-Week:N', title="Year-Week",axis=alt.Axis(labelAngle=45)),
-        y=alt.Y("count()", title="Repeat Visits Per Week", axis=alt.Axis(labelAngle=0)),
+        y=alt.Y('People:Q', title="Repeat Visits Per Week", axis=alt.Axis(labelAngle=0)),
         color=alt.Color('Repeat Visits Per Week:N')
     ).interactive()
 
-    st.altair_chart(chart2, theme=None, use_container_width=True)
+    altair_chart(chart2, theme=None, use_container_width=True)
     # print_summary_stats(df2.groupby('Repeat Visits Per Week'))
     print_chart_df(df2)
     # # note - missing tailgaters
@@ -440,70 +491,111 @@ def swiper_patterns(df, compare_option="Experiment", tab="Baseline"):
     # # note - WFH is still work :)
 
 
-def generate_fake_data(df):
-    # add 2 months to baseline data
-    faux_df = df.copy()
-    faux_df['Access Date'] = df['Access Date'] + relativedelta(months=+4)
-    faux_df['Day Of Week'] = pd.to_datetime(faux_df['Access Date'], format='%Y-%m-%d')
-    faux_df['Day Of Week'] = faux_df['Day Of Week'].dt.day_name()
-    faux_df = remove_weekend_data(faux_df)
-    df = pd.concat([df, faux_df], ignore_index=True)
-    return df
-
-@st.cache
-def convert_df(df):
-    # IMPORTANT: Cache the conversion to prevent computation on every rerun
-    return df.to_csv().encode('utf-8')
-
 def sidebar(raw_df):
     # Filter options - person type, dates, weekend
     _, _, person_types = extract_variables(raw_df)
     st.subheader("""Filter Options""")
-    df = filter_options(raw_df, person_types)
+    site = select_site(raw_df)
+    # every site, for the all sites table - the tabs only get the selected one
+    sites_df = filter_options(raw_df, person_types)
+    df = apply_filters(sites_df, FilterSpec(sites=frozenset([site.name])))
     st.write("""
         ---
         """)
     st.subheader("""Comparison Tab Option - Only Affects Some Graphs""")
-    compare_option = st.radio("Compare By", ("Experiment", "Quarter"), 0, horizontal=True)
+    # Compare By is at the top of the comparison tab, see comparison_fragment
     # DEBUG
     debug = st.radio("Debug Comparison Tab?", (True, False), 1, horizontal=True)
+    # filled in once the tabs have run, see timings_panel
+    timings = st.container()
+    report = memory_report(raw_df)
+    if report is not None:
+        with st.expander("Memory footprint of cleaned data"):
+            st.dataframe(report.style.format({'Saved': '{:.0%}'}, na_rep=''))
     # DOWNLOAD CLEAN CVS option
     st.write("""
     ---
     """)
     st.subheader("""Further Analysis""")
     st.write('To run further analysis, download cvs. Data is anonymized and door agnostic')
-    csv = convert_df(raw_df)
+    export_format = st.radio("Download format", list(export_formats), 0, horizontal=True)
+    extension, mime, _ = export_formats[export_format]
     st.download_button(
-        label="Download clean data as CSV",
-        data=csv,
-        file_name='anonymous_door_data.csv',
-        mime='text/csv'
+        label=f"Download clean data as {export_format}",
+        # only written when the button is clicked - see export.py
+        data=lambda: export_file(raw_df, export_format),
+        file_name=f'anonymous_door_data.{extension}',
+        mime=mime,
+        on_click='ignore'
     )
-    return df, debug, compare_option
+    return df, sites_df, site, debug, timings
+
+
+@st.fragment
+def comparison_fragment(df, site, debug=False):
+    # Compare By only changes the comparison charts, so changing it reruns this fragment & not the script
+    compare_option = st.radio("Compare By", ("Experiment", "Quarter"), 0, horizontal=True, key="compare_by")
+    with stage('comparison report', rows=len(df)):
+        report = cached_report(comparison_report, df, compare_option, debug, site)
+    with stage('comparison tab'):
+        comparison_tab(report, compare_option, debug)
+
+
+def timings_panel(container):
+    records = stage_records()
+    with container.expander("Stage timings"):
+        st.dataframe(stage_report(records).style.format(
+            {'Start (s)': '{:.3f}', 'Seconds': '{:.3f}', 'Rows': '{:,.0f}', 'Process RSS Delta (MB)': '{:+.1f}'},
+            na_rep='',
+        ))
+        st.download_button(
+            label="Download timings as JSON",
+            data=stages_json(records),
+            file_name='stage_timings.json',
+            mime='application/json'
+        )
 
 
 if __name__ == "__main__":
     is_unlocked = False
-    raw_df, is_unlocked = upload_data_file()
+    reset_stages()
+    raw_df, door_counts, is_unlocked = upload_data_file()
 
 
     if is_unlocked:
         with st.sidebar:
-            df, debug, compare_option = sidebar(raw_df)
-
-        tab1, tab2 = st.tabs(["Baseline", "Comparison"])
+            df, sites_df, site, debug, timings = sidebar(raw_df)
+
+        # both tabs' reports start computing now, in the background, the open tab's first - each tab waits for
+        # its own, & the other one is ready by the time it's opened
+        with stage('start background reports'):
+            reports = [
+                (baseline_report, (df, site), {'door_counts': door_counts}),
+                (sites_report, (sites_df,), {}),
+                (comparison_report, (df, st.session_state.get("compare_by", "Experiment"), debug, site), {}),
+            ]
+            if st.session_state.get("tab") == "Comparison":
+                reports.reverse()
+            submit_reports(reports)
+
+        # switching tabs reruns the script, and only the open tab is computed & drawn
+        tab1, tab2 = st.tabs(["Baseline", "Comparison"], key="tab", on_change="rerun")
         # App Output
 
-        with tab1:
-            baseline_tab(df)
+        if tab1.open:
+            with tab1:
+                with stage('baseline report', rows=len(df)):
+                    report = cached_report(baseline_report, df, site, door_counts=door_counts)
+                with stage('all sites report', rows=len(sites_df)):
+                    sites_summary = cached_report(sites_report, sites_df)
+                with stage('baseline tab'):
+                    baseline_tab(report, sites_summary)
+
+        if tab2.open:
+            with tab2:
+                comparison_fragment(df, site, debug)
 
-        with tab2:
-            if debug:
-                faux_df = generate_fake_data(df)
-                comparison_tab(faux_df, compare_option, debug=True)
-            else:
-                comparison_tab(df, compare_option)
+        timings_panel(timings)
     else:
 
         st.code('Welcome! Upload the Correct Data to Unlock')
@@ -0,0 +1,61 @@
+import functools
+import hashlib
+import logging
+import os
+import secrets
+import numpy as np
+import pandas as pd
+
+# anon_id is a keyed hash of the CDSID, so the same person gets the same id in every upload & in the store.
+# the key comes from PETRI_PSEUDONYM_KEY, or is generated once into pseudonym_key_path - keep it out of git.
+# the path is next to this file, not the working directory, so the app & report.py started from anywhere agree
+pseudonym_key_env = 'PETRI_PSEUDONYM_KEY'
+pseudonym_key_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.pseudonym_key')
+# 4 byte digests -> uint32 ids, half the width of an int64 id. collisions are negligible at lab sizes
+# (~1 in 2 million for 100 people)
+pseudonym_digest_size = 4
+pseudonym_dtype = 'uint32'
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def pseudonym_key():
+    key = os.environ.get(pseudonym_key_env)
+    if key:
+        key = key.encode()
+    else:
+        key = _read_or_create_key_file(pseudonym_key_path)
+    if len(key) > hashlib.blake2b.MAX_KEY_SIZE:
+        raise ValueError(f'{pseudonym_key_env} must be at most {hashlib.blake2b.MAX_KEY_SIZE} bytes')
+    return key
+
+
+def _read_or_create_key_file(path):
+    if not os.path.exists(path):
+        # written to a temp file & linked into place, so worker processes racing here all end up with one key
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp_path, path)
+            # a new key means new ids - anything stored with an earlier key no longer matches
+            logger.warning('generated a new pseudonym key in %s', path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(path) as f:
+        return f.read().strip().encode()
+
+
+def pseudonymize(values, key=None):
+    # hash each distinct value once, then broadcast the ids back onto the rows
+    key = pseudonym_key() if key is None else key
+    codes, uniques = pd.factorize(values)
+    digests = b''.join(
+        hashlib.blake2b(str(value).encode(), key=key, digest_size=pseudonym_digest_size).digest()
+        for value in uniques
+    )
+    ids = np.frombuffer(digests, dtype='<u4').astype(pseudonym_dtype)
+    return ids[codes]
@@ -0,0 +1,122 @@
+import argparse
+import html
+import json
+import os
+import sys
+import pandas as pd
+from analytics import baseline_report, comparison_report, sites_report
+from cleaning import clean_file, finish_clean
+from config import default_site, site_config, sites
+from filters import FilterSpec, apply_filters, default_holidays
+
+# nightly / scheduled runs: python report.py export.csv [more exports...] --out reports --format json html
+report_formats = ('json', 'parquet', 'html')
+
+
+def load_exports(paths, site=default_site):
+    partials = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            df, door_counts, error = clean_file(os.path.basename(path), f.read(), site)
+        if error is not None:
+            raise SystemExit(f'{path}: {error}')
+        partials.append((df, door_counts))
+    # (df, door counts)
+    return finish_clean(partials)
+
+
+def build_reports(df, spec, compare_option="Experiment", site=default_site, door_counts=None):
+    # the site table covers every site; the baseline & comparison sections only the chosen one
+    df = apply_filters(df, spec)
+    site_df = apply_filters(df, FilterSpec(sites=frozenset([site])))
+    if site_df.empty:
+        raise SystemExit(f'no rows for site {site} - the exports are tagged {", ".join(map(str, df["Site"].unique()))}')
+    return {
+        'sites': sites_report(df),
+        'baseline': baseline_report(site_df, site_config(site), door_counts),
+        'comparison': comparison_report(site_df, compare_option, site=site_config(site)),
+    }
+
+
+def flatten(frame):
+    # plain columns & a default index, so every writer can take the frame as is
+    frame = frame.copy()
+    if isinstance(frame.columns, pd.MultiIndex):
+        frame.columns = [' '.join(str(level) for level in column) for column in frame.columns]
+    if not isinstance(frame.index, pd.RangeIndex):
+        frame = frame.reset_index()
+    frame.columns = [str(column) for column in frame.columns]
+    return frame
+
+
+def write_json(reports, out_dir):
+    path = os.path.join(out_dir, 'report.json')
+    with open(path, 'w') as f:
+        json.dump({
+            section: {
+                name: json.loads(flatten(frame).to_json(orient='records', date_format='iso'))
+                for name, frame in frames.items()
+            }
+            for section, frames in reports.items()
+        }, f, indent=2)
+    return [path]
+
+
+def write_parquet(reports, out_dir):
+    paths = []
+    for section, frames in reports.items():
+        os.makedirs(os.path.join(out_dir, section), exist_ok=True)
+        for name, frame in frames.items():
+            path = os.path.join(out_dir, section, f'{name}.parquet')
+            flatten(frame).to_parquet(path, index=False)
+            paths.append(path)
+    return paths
+
+
+def write_html(reports, out_dir):
+    path = os.path.join(out_dir, 'report.html')
+    parts = ['<html><head><meta charset="utf-8"><title>Petri door data report</title></head><body>']
+    for section, frames in reports.items():
+        parts.append(f'<h1>{html.escape(section.title())}</h1>')
+        for name, frame in frames.items():
+            parts.append(f'<h2>{html.escape(name.replace("_", " ").title())}</h2>')
+            parts.append(frame.to_html(float_format='{:,.2f}'.format))
+    parts.append('</body></html>')
+    with open(path, 'w') as f:
+        f.write('\n'.join(parts))
+    return [path]
+
+
+writers = {'json': write_json, 'parquet': write_parquet, 'html': write_html}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compute the dashboard analytics without streamlit.')
+    parser.add_argument('exports', nargs='+', help='door data exports (csv or xlsx)')
+    parser.add_argument('--out', default='reports', help='output directory')
+    parser.add_argument('--format', nargs='+', choices=report_formats, default=list(report_formats))
+    parser.add_argument('--site', choices=list(sites), default=default_site,
+                        help='site of exports without a Site column, and the site the baseline & comparison cover')
+    parser.add_argument('--compare-by', choices=('Experiment', 'Quarter'), default='Experiment')
+    parser.add_argument('--keep-weekends', action='store_true')
+    parser.add_argument('--keep-holidays', action='store_true')
+    parser.add_argument('--person-types', nargs='+', help='only include these person types')
+    args = parser.parse_args(argv)
+
+    # same defaults as the dashboard sidebar
+    spec = FilterSpec(
+        remove_weekends=not args.keep_weekends,
+        holidays=() if args.keep_holidays else default_holidays,
+        person_types=frozenset(args.person_types) if args.person_types else None,
+    )
+    df, door_counts = load_exports(args.exports, args.site)
+    reports = build_reports(df, spec, args.compare_by, args.site, door_counts)
+
+    os.makedirs(args.out, exist_ok=True)
+    for report_format in args.format:
+        for path in writers[report_format](reports, args.out):
+            print(path)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+from cache import cache_get, cache_put
+
+# moving averages & week over week change of a daily series. the last result per series is kept, so a rerun
+# after new days are appended (or a different filter that only changes later days) recomputes just the days
+# from the first change on
+rolling_windows = (7, 28)
+rolling_cache_max_entries = 64
+
+
+def rolling_names(value, windows=rolling_windows):
+    return [f'{value} {window}d Avg' for window in windows] + [f'{value} WoW Change']
+
+
+def _metrics(dates, values, windows):
+    # windows are calendar days ending on (& including) each day, averaged over the days with data in them
+    series = pd.Series(values, index=dates)
+    columns = {f'{window}d Avg': series.rolling(f'{window}D').mean().to_numpy() for window in windows}
+    # vs the same weekday a week earlier, NaN if that day has no data
+    columns['WoW Change'] = values - series.reindex(dates - pd.Timedelta(days=7)).to_numpy()
+    return columns
+
+
+def _unchanged_days(previous, dates, values):
+    # how many leading days are the same as in previous - the metrics of those days can't have changed
+    n = min(len(previous), len(dates))
+    previous_values = previous['Value'].to_numpy()[:n]
+    same = (previous['Access Date'].to_numpy()[:n] == dates[:n].to_numpy()) & (
+        (previous_values == values[:n]) | np.isnan(previous_values) & np.isnan(values[:n]))
+    return n if same.all() else int(np.argmin(same))
+
+
+def rolling_metrics(dates, values, windows=rolling_windows, previous=None):
+    # dates: sorted unique days, values: the series on those days. previous: an earlier result for the same series
+    dates = pd.DatetimeIndex(dates)
+    values = np.asarray(values, dtype=float)
+    keep = _unchanged_days(previous, dates, values) if previous is not None else 0
+    if previous is not None and keep == len(dates) == len(previous):
+        return previous
+    # enough earlier days for the longest window (& the week over week lookup) of the first recomputed day
+    lookback = pd.Timedelta(days=max(max(windows, default=0), 7))
+    start = dates.searchsorted(dates[keep] - lookback) if keep < len(dates) else keep
+    metrics = pd.DataFrame({'Access Date': dates[start:], 'Value': values[start:],
+                            **_metrics(dates[start:], values[start:], windows)}).iloc[keep - start:]
+    if keep:
+        metrics = pd.concat([previous.iloc[:keep], metrics], ignore_index=True)
+    return metrics.reset_index(drop=True)
+
+
+def add_rolling(df, value, key, by=None, windows=rolling_windows):
+    # df with rolling_names(value) columns added. df has one row per Access Date (per by group), sorted by date.
+    # key names the series across reruns, e.g. (site, 'swipes') - any key works, a series that changed is
+    # just recomputed from where it changed
+    names = rolling_names(value, windows)
+    groups = df.groupby(by, observed=True).indices.items() if by else [(None, np.arange(len(df)))]
+    dates, values = df['Access Date'].to_numpy(), df[value].to_numpy(dtype=float)
+    columns = np.full((len(df), len(names)), np.nan)
+    for group, rows in groups:
+        cache_key = (key, value, windows, group)
+        metrics = rolling_metrics(dates[rows], values[rows], windows, cache_get('rolling', cache_key))
+        cache_put('rolling', cache_key, metrics, rolling_cache_max_entries)
+        columns[rows] = metrics.iloc[:, 2:].to_numpy()
+    return df.assign(**dict(zip(names, columns.T)))
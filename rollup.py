@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+import pandas as pd
+from attendance import Attendance, active_streaks, build_attendance, cohort_retention, visits_per_period
+from cache import cache_get, cache_put
+from datedim import assign_phases, build_date_dim
+
+rollup_cache_max_entries = 16
+
+
+@dataclass
+class Rollup:
+    # unique swipes per Access Date x Person Type x Day Of Week (x Site)
+    daily: pd.DataFrame
+    # sorted unique dates / person ids
+    days: pd.Index
+    persons: pd.Index
+    # person x day bitset of who came in when (see attendance.py)
+    attendance: Attendance
+
+
+def build_rollup(df):
+    keys = ['Access Date', 'Person Type', 'Day Of Week'] + (['Site'] if 'Site' in df else [])
+    daily = (
+        df.groupby(keys, observed=True)
+        .size()
+        .rename('Swipe Count')
+        .reset_index()
+    )
+    day_codes, days = pd.factorize(df['Access Date'], sort=True)
+    person_codes, persons = pd.factorize(df['anon_id'], sort=True)
+    attendance = build_attendance(person_codes, day_codes, persons, days)
+    return Rollup(daily=daily, days=attendance.days, persons=attendance.persons, attendance=attendance)
+
+
+def get_rollup(df):
+    # built once per dataset - both tabs and every chart read from the same rollup
+    fingerprint = df.attrs.get('fingerprint')
+    if fingerprint is None:
+        return build_rollup(df)
+    key = (fingerprint, len(df))
+    rollup = cache_get('rollup', key)
+    if rollup is None:
+        rollup = build_rollup(df)
+        cache_put('rollup', key, rollup, rollup_cache_max_entries)
+    return rollup
+
+
+def date_range(rollup):
+    return rollup.days.min(), rollup.days.max()
+
+
+def daily_counts(rollup, person_type_contains=None):
+    # same shape as unique_swipes_per_day: one row per Access Date with its Swipe Count
+    daily = rollup.daily
+    if person_type_contains is not None:
+        daily = daily[daily['Person Type'].str.contains(person_type_contains)]
+    return daily.groupby('Access Date')['Swipe Count'].sum().reset_index()
+
+
+def repeat_visits_per_week(rollup):
+    # days visited per person per Year-Week (weeks starting Sunday, as '%Y-%U')
+    weeks = build_date_dim(rollup.days)['Year-Week']
+    return visits_per_period(rollup.attendance, weeks, 'Year-Week', 'Repeat Visits Per Week')
+
+
+def weekly_streaks(rollup):
+    # per person: weeks with a visit & runs of consecutive weeks with one
+    return active_streaks(rollup.attendance, build_date_dim(rollup.days)['Year-Week'])
+
+
+def phase_retention(rollup, phases):
+    # people grouped by the first phase they came in, & the share of them who came in during each phase
+    return cohort_retention(rollup.attendance, assign_phases(rollup.days, phases))
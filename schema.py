@@ -0,0 +1,56 @@
+import calendar
+import pandas as pd
+from pseudonym import pseudonym_dtype
+
+day_of_week_dtype = pd.CategoricalDtype(list(calendar.day_name), ordered=True)
+# low-cardinality labels that are stored once per category instead of once per row
+category_columns = ['Person Type', 'Phase', 'Site']
+
+
+def record_parsed_memory(df):
+    # the footprint straight out of the reader, before cleaning converts anything - the memory report's before
+    df.attrs['parsed_memory'] = df.memory_usage(deep=True).to_dict()
+    return df
+
+
+def sum_parsed_memory(frames):
+    # parsed footprints of the chunks / files frames were cleaned from. None if any of them has none
+    parsed = [frame.attrs.get('parsed_memory') for frame in frames]
+    if not parsed or any(memory is None for memory in parsed):
+        return None
+    return pd.DataFrame(parsed).sum().to_dict()
+
+
+def compact_dtypes(df):
+    # as parsed when cleaning recorded it, else as passed in (e.g. the store, already compact on disk)
+    before = df.attrs.get('parsed_memory') or df.memory_usage(deep=True).to_dict()
+    if 'Access Date' in df and not pd.api.types.is_datetime64_dtype(df['Access Date']):
+        # pandas 1.x only has datetime64[ns] - still 8 bytes/row vs a python date object per row
+        df['Access Date'] = pd.to_datetime(df['Access Date'])
+    if 'Day Of Week' in df:
+        df['Day Of Week'] = df['Day Of Week'].astype(day_of_week_dtype)
+    for column in category_columns:
+        if column in df:
+            # categories read straight from an export can include values that cleaning dropped
+            df[column] = df[column].astype('category').cat.remove_unused_categories()
+    if 'anon_id' in df:
+        # a fixed width, so every upload & stored part has the same id type
+        df['anon_id'] = df['anon_id'].astype(pseudonym_dtype)
+    after = df.memory_usage(deep=True)
+    df.attrs['memory_report'] = {'before': before, 'after': after.to_dict()}
+    return df
+
+
+def memory_report(df):
+    # bytes per column as parsed / cleaned, with a total row
+    report = df.attrs.get('memory_report')
+    if report is None:
+        return None
+    report = pd.DataFrame({
+        'As Parsed (bytes)': pd.Series(report['before']),
+        'Cleaned (bytes)': pd.Series(report['after']),
+    }).fillna(0).astype('int64')
+    report.loc['Total'] = report.sum()
+    # blank for columns cleaning adds (anon_id, Day Of Week)
+    report['Saved'] = 1 - report['Cleaned (bytes)'] / report['As Parsed (bytes)'].where(report['As Parsed (bytes)'] > 0)
+    return report
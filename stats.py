@@ -0,0 +1,90 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+import pandas as pd
+
+# is a phase's change in daily swipes more than noise? bootstrap confidence intervals for the change in mean
+# & permutation test p-values, every phase against the baseline (first) phase
+stats_resamples = 10_000
+stats_confidence = .95
+# resamples are drawn as (resamples x days) index matrices, at most this many values at a time
+resample_batch_values = 2_000_000
+
+
+def _batches(n_resamples, n_values):
+    size = max(1, resample_batch_values // max(n_values, 1))
+    for start in range(0, n_resamples, size):
+        yield min(size, n_resamples - start)
+
+
+def bootstrap_mean_diffs(a, b, n_resamples, rng):
+    # mean(b) - mean(a), each resampled with replacement, for n_resamples resamples
+    diffs = []
+    for batch in _batches(n_resamples, len(a) + len(b)):
+        a_means = a[rng.integers(0, len(a), (batch, len(a)))].mean(axis=1)
+        b_means = b[rng.integers(0, len(b), (batch, len(b)))].mean(axis=1)
+        diffs.append(b_means - a_means)
+    return np.concatenate(diffs)
+
+
+def permutation_mean_diffs(a, b, n_permutations, rng):
+    # mean(b) - mean(a) after shuffling the phase labels, one permutation per row
+    pooled = np.concatenate([a, b])
+    diffs = []
+    for batch in _batches(n_permutations, len(pooled)):
+        shuffled = pooled[rng.random((batch, len(pooled))).argsort(axis=1)]
+        diffs.append(shuffled[:, len(a):].mean(axis=1) - shuffled[:, :len(a)].mean(axis=1))
+    return np.concatenate(diffs)
+
+
+def compare_samples(a, b, n_resamples=stats_resamples, confidence=stats_confidence, seed=None):
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    result = {
+        'Baseline Days': len(a),
+        'Phase Days': len(b),
+        'Baseline Mean': a.mean() if len(a) else np.nan,
+        'Phase Mean': b.mean() if len(b) else np.nan,
+    }
+    result['Difference'] = result['Phase Mean'] - result['Baseline Mean']
+    if len(a) < 2 or len(b) < 2:
+        return {**result, 'CI Low': np.nan, 'CI High': np.nan, 'p-value': np.nan}
+    rng = np.random.default_rng(seed)
+    tail = (1 - confidence) / 2
+    low, high = np.quantile(bootstrap_mean_diffs(a, b, n_resamples, rng), [tail, 1 - tail])
+    permuted = permutation_mean_diffs(a, b, n_resamples, rng)
+    # two sided, counting the observed split as one of the permutations
+    p_value = (np.count_nonzero(np.abs(permuted) >= abs(result['Difference'])) + 1) / (n_resamples + 1)
+    return {**result, 'CI Low': low, 'CI High': high, 'p-value': p_value}
+
+
+def phase_tests(df, value='Swipe Count', by=None, n_resamples=stats_resamples, confidence=stats_confidence,
+                seed=0, workers=None):
+    # df: one row per day with a Phase column (analytics.swipe_counts). one row per (by group, phase) compared
+    # to the baseline phase in the same group. workers > 1 spreads the comparisons over a process pool;
+    # each comparison has its own seed, so the results don't depend on workers
+    keys = [by] if isinstance(by, str) else list(by or [])
+    df = df[df['Phase'].notna()]
+    phases = [phase for phase in df['Phase'].cat.categories if phase in set(df['Phase'])]
+    if len(phases) < 2:
+        return pd.DataFrame()
+
+    labels, samples, baselines = [], [], []
+    groups = df.groupby(keys if len(keys) > 1 else keys[0], observed=True) if keys else [((), df)]
+    for group, rows in groups:
+        group = group if isinstance(group, tuple) else (group,)
+        values = {phase: rows.loc[rows['Phase'] == phase, value].to_numpy() for phase in phases}
+        for phase in phases[1:]:
+            labels.append(dict(zip(keys, group), Phase=phase))
+            baselines.append(values[phases[0]])
+            samples.append(values[phase])
+
+    seeds = np.random.SeedSequence(seed).spawn(len(samples))
+    args = (baselines, samples, repeat(n_resamples), repeat(confidence), seeds)
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(compare_samples, *args))
+    else:
+        results = list(map(compare_samples, *args))
+    tests = pd.DataFrame([{**label, **result} for label, result in zip(labels, results)])
+    tests.insert(len(keys) + 1, 'Baseline', phases[0])
+    return tests
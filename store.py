@@ -0,0 +1,98 @@
+import hashlib
+import os
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from config import default_site
+from schema import compact_dtypes
+
+# cleaned door data, one parquet partition per month: door_store/month=2023-02/part-*.parquet
+store_dir = 'door_store'
+partition_col = 'month'
+# per reader daily counts (cleaning.count_door_swipes) for the same days, under the store:
+# door_store/_door_counts/month=2023-02/part-*.parquet - the leading _ keeps it out of the swipe dataset
+door_counts_dir = '_door_counts'
+
+
+def store_exists(path=store_dir):
+    return os.path.isdir(path) and any(os.scandir(path))
+
+
+def stored_days(path=store_dir):
+    # (site, date) pairs already in the store
+    if not store_exists(path):
+        return pd.MultiIndex.from_arrays([[], []], names=['Site', 'Access Date'])
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    # only the site & date columns are read
+    columns = [column for column in ('Site', 'Access Date') if column in dataset.schema.names]
+    days = dataset.to_table(columns=columns).to_pandas().drop_duplicates()
+    if 'Site' not in days:
+        days.insert(0, 'Site', default_site)
+    return pd.MultiIndex.from_frame(days[['Site', 'Access Date']].astype({'Site': 'object'}))
+
+
+def _new_days(df, days):
+    # rows of df whose (site, date) isn't in days. only the few hundred site x date combinations are looked up,
+    # & the answers are mapped back onto the rows by their codes
+    site_codes, site_names = pd.factorize(df['Site'])
+    date_codes, dates = pd.factorize(df['Access Date'])
+    stored = pd.MultiIndex.from_product([pd.Index(site_names).astype('object'), dates]).isin(days)
+    return df[~stored.reshape(len(site_names), len(dates))[site_codes, date_codes]]
+
+
+def _write_months(df, path):
+    df = df.assign(**{partition_col: pd.to_datetime(df['Access Date']).dt.strftime('%Y-%m')})
+    # attrs (fingerprint, memory report) aren't stored with the rows
+    df.attrs = {}
+    pq.write_to_dataset(
+        pa.Table.from_pandas(df, preserve_index=False),
+        root_path=path,
+        partition_cols=[partition_col],
+        # unique file names so earlier parts of the same month are kept
+        basename_template=f'part-{uuid.uuid4().hex}-{{i}}.parquet',
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+
+def append_to_store(df, door_counts=None, path=store_dir):
+    # only days that aren't stored yet for a site are written - re-uploading an overlapping export is a no-op.
+    # door_counts (cleaning.count_door_swipes) for the same upload are stored for the same new days
+    days = stored_days(path)
+    new_df = _new_days(df, days)
+    if new_df.empty:
+        return 0
+    if door_counts is not None:
+        _write_months(_new_days(door_counts, days), os.path.join(path, door_counts_dir))
+    _write_months(new_df, path)
+    return len(new_df)
+
+
+def load_door_counts(path=store_dir):
+    path = os.path.join(path, door_counts_dir)
+    if not store_exists(path):
+        return None
+    df = pq.read_table(path, memory_map=True).to_pandas().drop(columns=[partition_col])
+    return df.sort_values('Access Date', ignore_index=True)
+
+
+def load_store(path=store_dir):
+    if not store_exists(path):
+        return None
+    table = pq.read_table(path, memory_map=True)
+    df = table.to_pandas().drop(columns=[partition_col])
+    if 'Site' not in df:
+        # stored before exports were tagged with a site
+        df['Site'] = default_site
+    df = compact_dtypes(df.sort_values('Access Date', ignore_index=True))
+    df.attrs['fingerprint'] = store_fingerprint(path)
+    return df
+
+
+def store_fingerprint(path=store_dir):
+    # part files are write-once with unique names, so the listing identifies the stored data
+    parts = sorted(
+        os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+    )
+    return hashlib.blake2b('\n'.join(parts).encode(), digest_size=16).hexdigest()
@@ -0,0 +1,117 @@
+import argparse
+import datetime
+import io
+import sys
+import numpy as np
+import pandas as pd
+from config import date_format, site_config
+
+# seeded fake exports, shaped like the real ones, for benchmarks & demos:
+#   python synthetic.py 1000000 export.csv --seed 0
+
+person_type_weights = {'EMPLOYEE': .75, 'CONTRACTOR': .15, 'TEMP EMPLOYEE': .10}
+# Monday ... Sunday - relative chance of a swipe on that day
+weekday_weights = np.array([.8, .9, 1., .9, .6, .05, .03])
+# post experiment, the experiment day gets busier
+experiment_weekday = 2
+experiment_boost = 1.6
+readers = ['Lab Door A', 'Lab Door B', 'Side Door']
+transaction_types = ['Granted', 'Denied']
+synthetic_chunk_rows = 1_000_000
+
+
+def synthetic_people(n, rng):
+    types = rng.choice(list(person_type_weights), n, p=list(person_type_weights.values()))
+    return pd.DataFrame({
+        'Person Type': types,
+        'CDSID': [f'S{i:07d}' for i in range(n)],
+        'Last Name': [f'Last{i}' for i in range(n)],
+        'First Name': [f'First{i}' for i in range(n)],
+        # some people come in most days, most come in once or twice a week
+        'propensity': rng.gamma(2., 1., n) * np.where(types == 'EMPLOYEE', 1., .5),
+    })
+
+
+def synthetic_days(start, days, site):
+    dates = pd.date_range(start, periods=days)
+    weights = weekday_weights[dates.dayofweek].copy()
+    weights[(dates >= pd.Timestamp(site.experiment_start_date)) & (dates.dayofweek == experiment_weekday)] *= experiment_boost
+    return dates, weights / weights.sum()
+
+
+def iter_synthetic_chunks(rows, seed=0, people=None, start=None, days=180, site=None, chunk_rows=synthetic_chunk_rows):
+    # raw export frames, chunk_rows at a time - the same seed always gives the same rows
+    site = site or site_config()
+    start = start or site.baseline_start_date or datetime.date(2022, 11, 1)
+    people = people or max(50, min(rows // 200, 100_000))
+    seeds = np.random.SeedSequence(seed)
+    people_seed, *chunk_seeds = seeds.spawn(1 + -(-rows // chunk_rows))
+
+    people_df = synthetic_people(people, np.random.default_rng(people_seed))
+    person_p = (people_df['propensity'] / people_df['propensity'].sum()).to_numpy()
+    dates, day_p = synthetic_days(start, days, site)
+    date_strings = dates.strftime(date_format)
+
+    columns = {
+        column: pd.CategoricalDtype(sorted(people_df[column].unique()))
+        for column in ['Person Type', 'CDSID', 'Last Name', 'First Name']
+    }
+    for i, chunk_seed in enumerate(chunk_seeds):
+        rng = np.random.default_rng(chunk_seed)
+        n = min(chunk_rows, rows - i * chunk_rows)
+        person = rng.choice(people, n, p=person_p)
+        chunk = pd.DataFrame({
+            # header names arrive truncated, as in a real export
+            'Person': pd.Categorical(people_df['Person Type'].to_numpy()[person], dtype=columns['Person Type']),
+            'Access': pd.Categorical.from_codes(rng.choice(days, n, p=day_p), categories=date_strings),
+            'CDSID': pd.Categorical(people_df['CDSID'].to_numpy()[person], dtype=columns['CDSID']),
+            'Last Name': pd.Categorical(people_df['Last Name'].to_numpy()[person], dtype=columns['Last Name']),
+            'First Name': pd.Categorical(people_df['First Name'].to_numpy()[person], dtype=columns['First Name']),
+            'Reader Description': pd.Categorical.from_codes(rng.integers(0, len(readers), n), categories=readers),
+            'Transaction Type': pd.Categorical.from_codes(
+                (rng.random(n) < .03).astype(np.int8), categories=transaction_types),
+            'Category Used': np.nan,
+        })
+        yield chunk
+
+
+def synthetic_export(rows, seed=0, **kwargs):
+    return pd.concat(iter_synthetic_chunks(rows, seed, **kwargs), ignore_index=True)
+
+
+def write_synthetic_csv(f, rows, seed=0, **kwargs):
+    # written chunk by chunk, so 50M rows never have to fit in memory at once
+    for i, chunk in enumerate(iter_synthetic_chunks(rows, seed, **kwargs)):
+        if i == 0:
+            # real exports split the header over 2 rows
+            header = pd.DataFrame([{'Person': 'Type', 'Access': 'Date'}], columns=chunk.columns)
+            header.to_csv(f, index=False)
+        chunk.to_csv(f, header=False, index=False)
+
+
+def write_synthetic_export(path, rows, seed=0, **kwargs):
+    with open(path, 'w', newline='') as f:
+        write_synthetic_csv(f, rows, seed, **kwargs)
+    return path
+
+
+def synthetic_csv(rows, seed=0, **kwargs):
+    # the bytes of an uploaded export .csv
+    f = io.StringIO()
+    write_synthetic_csv(f, rows, seed, **kwargs)
+    return f.getvalue().encode('utf-8')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a seeded synthetic door data export.')
+    parser.add_argument('rows', type=int)
+    parser.add_argument('path')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--people', type=int)
+    args = parser.parse_args(argv)
+    print(write_synthetic_export(args.path, args.rows, args.seed, days=args.days, people=args.people))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,23 @@
+from streamlit.testing.v1 import AppTest
+
+
+def select_site_app(site_names):
+    import pandas as pd
+    import streamlit as st
+    from utils import select_site
+    site = select_site(pd.DataFrame({'Site': pd.Categorical(site_names)}))
+    st.write(site.name)
+
+
+def test_select_site_stops_on_unregistered_sites():
+    at = AppTest.from_function(select_site_app, args=(['Paris', 'Paris', 'Berlin'],)).run()
+    assert not at.exception
+    assert 'Berlin, Paris' in at.error[0].value
+    assert not at.markdown
+
+
+def test_select_site_warns_about_unregistered_sites():
+    at = AppTest.from_function(select_site_app, args=(['London', 'Paris'],)).run()
+    assert not at.exception
+    assert 'Paris' in at.warning[0].value
+    assert at.markdown[0].value == 'London'
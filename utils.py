@@ -1,177 +1,266 @@
 import streamlit as st
 import pandas as pd
-import datetime
-import calendar
-
-date_format = '%d/%m/%Y'
-day_names = list(calendar.day_name)
-experiment_start_date = datetime.date(2023, 2, 8)
-lab_population_n = 68
-
-phases = pd.DataFrame([
-    {
-        "start": "2022-11-01",
-        "end": "2023-02-07",
-        "phase": "Pre-Experiment"
-    },
-    {
-        "start": "2023-02-08",
-        # "end": "2015-12-31",
-        "phase": "Post-Experiment"
-    }
-])
-
-def fix_headers(df):
-    # fix headers - weird split across 2 rows
-    return df.rename(
-        columns={'Person': 'Person Type', 'Access': 'Access Date', },
-    )
+import hashlib
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from cache import cache_get, cache_put, cached, declare_cache, frame_key
+from cleaning import clean_file, finish_clean
+from config import date_format, day_names, default_site, experiment_start_date, lab_population_n, phases, site_config, sites
+from datedim import add_date_columns
+from export import export_file, export_formats
+from schema import memory_report
+from filters import FilterSpec, apply_filters, default_holidays, format_date_range
+from instrument import reset_stages, stage, stage_records, stage_report, stages_json, timed
+from store import append_to_store, load_door_counts, load_store, store_exists, store_fingerprint
+
+# cleaned uploads, keyed by a hash of the uploaded bytes (least recently used evicted first, to disk)
+clean_cache_max_entries = 8
+# tab reports, keyed by the dataset fingerprint & their options
+report_cache_max_entries = 16
+# the stored history as read back, keyed by its part file listing (store_fingerprint), & the uploads already
+# appended to each version of it - reruns neither append nor read the store again
+store_cache_max_entries = 2
+appended_cache_max_entries = 64
+declare_cache('clean', clean_cache_max_entries, spill=True)
+declare_cache('partial', clean_cache_max_entries, spill=True)
+declare_cache('report', report_cache_max_entries, spill=True)
+# reports started in the background as soon as the filtered data exists (see submit_report), shared by every
+# session. threads rather than processes, so the frames & results aren't pickled between processes. one worker:
+# the pandas work mostly holds the GIL, so more threads slow the open tab's report down more than they help
+report_workers = 1
+_report_pool = ThreadPoolExecutor(max_workers=report_workers, thread_name_prefix='report')
+_pending_reports = {}
+_pending_lock = threading.Lock()
 
 
 def remove_weekend_data(df):
-    if df is not None:
-        # locate indices
-        sat_idx = df[df['Day Of Week'] == 'Saturday'].index
-        sun_idx = df[df['Day Of Week'] == 'Sunday'].index
-        # drop by indices
-        df = df.drop(sat_idx)
-        df = df.drop(sun_idx)
-    return df
+    return apply_filters(df, FilterSpec(remove_weekends=True))
 
-def remove_weekend(df):
-    remove = st.radio("Remove weekends?", (True, False), 0, horizontal=True)
-    if remove:
-        df = remove_weekend_data(df)
-    return df
+def remove_weekend():
+    return st.radio("Remove weekends?", (True, False), 0, horizontal=True)
 
 def filter_by_experiment_date(df):
-    if df is not None:
-        # locate indices
-        post_experiment_idx = df[(df['Access Date'] >= experiment_start_date)].index
-        # drop by indices
-        if post_experiment_idx is not None:
-            df = df.drop(post_experiment_idx)
-    return df
+    return apply_filters(df, FilterSpec(before_date=experiment_start_date))
 
 
-def remove_holiday_data(df):
-    if df is not None:
-        start_date, end_date = datetime.date(2022, 12, 17), datetime.date(2023, 1, 6)
-        # locate indices
-        holiday_idx = df[(df['Access Date'] >= start_date) & (df['Access Date'] <= end_date)].index
-        # drop by indices
-        if holiday_idx is not None:
-            df = df.drop(holiday_idx)
-    return df
+def remove_holiday_data(df, holidays=default_holidays):
+    return apply_filters(df, FilterSpec(holidays=tuple(holidays)))
 
 
-def remove_holiday(df, baseline=False):
-    remove = st.radio("Remove Holidays? (Sat, 17 Dec 2022 - Sun, 06 Jan 2023) ",
+def remove_holiday(holidays=default_holidays):
+    dates = ', '.join(format_date_range(start, end) for start, end, *_ in holidays)
+    remove = st.radio(f"Remove Holidays? ({dates}) ",
                       (True, False), 0, horizontal=True)
-    if baseline:
-        df = filter_by_experiment_date(df)
-    if remove:
-        df = remove_holiday_data(df)
-    return df
+    return tuple(holidays) if remove else ()
 
 
 def include_person_type_data(df, options, person_types):
-    if df is not None:
-        for type in person_types:
-            if type not in options:
-                person_type_idx = df[df['Person Type'] == type].index
-                df = df.drop(person_type_idx)
-    return df
+    return apply_filters(df, person_type_spec(options, person_types))
+
 
+def person_type_spec(options, person_types):
+    if all(type in options for type in person_types):
+        return FilterSpec()
+    return FilterSpec(person_types=frozenset(options))
 
-def include_persons(df, person_types):
+
+def include_persons(person_types):
     options = st.multiselect(
         'Who to include?',
         person_types,
         person_types,
     )
-    df = include_person_type_data(df, options, person_types)
-    return df
-
-
-def include_employees_only_data(df):
-    if df is not None:
-        df = df[df['Person Type'].str.contains("EMPLOYEE")].copy()
-    return df
+    return person_type_spec(options, person_types).person_types
 
 
-def filter_options(df, person_types, baseline=False):
-    # Remove Weekends button
-    df = remove_weekend(df)
+def unregistered_sites(df):
+    # sites in the data without an entry in config.sites
+    return sorted(set(df['Site'].dropna().unique()) - set(sites))
 
-    # Remove Holidays & Other Date Filters
-    df = remove_holiday(df, baseline)
 
-    # include all person types by default
-    df = include_persons(df, person_types)
-
-    return df
+def select_site(df):
+    # the tabs show one site at a time - only sites in the registry have a population & experiment dates
+    present = set(df['Site'].dropna().unique())
+    options = [name for name in sites if name in present]
+    unknown = unregistered_sites(df)
+    if not options:
+        st.error(f"No site in this data is registered in config.sites: {', '.join(unknown) or 'no rows'}")
+        st.stop()
+    if unknown:
+        st.warning(f"Only in the all sites table, not registered in config.sites: {', '.join(unknown)}")
+    if len(options) == 1:
+        return site_config(options[0])
+    return site_config(st.selectbox('Site', options))
 
-def remove_junk(df):
-    # gets rid of empty rows & that weird split if it's there in future
-    if 'Category Used' in df.columns:  # since empty, this might be removed in future
-        df.drop(columns=['Category Used'], inplace=True)  # empty column
-    return df.dropna()
 
-
-def fix_dates(df):
-    # convert to string to date
-    df['Access Date'] = pd.to_datetime(df['Access Date'], format=date_format)
-    df['Day Of Week'] = df['Access Date'].dt.day_name()
-    df['Access Date'] = df['Access Date'].dt.date
+def include_employees_only_data(df):
+    if df is not None:
+        df = df[df['Person Type'].str.contains("EMPLOYEE")].copy()
     return df
 
 
-def anonymize(df):
-    # if we want to make this more sophisticated... look at hashlib
-    df['anon_id'] = df['CDSID'].astype('category').cat.codes
-    return df.drop(columns=['Last Name', 'First Name', 'CDSID'])
-
-
-def count_one_swipe_per_day(df):
-    # we only care if person's card was used during a given day
-    df.drop(columns=['Reader Description', 'Transaction Type'], inplace=True)
-    return df.drop_duplicates(ignore_index=True)
+@timed('filters')
+def filter_options(df, person_types, baseline=False):
+    # the widgets only collect choices - all of them are applied below as one mask
+    spec = FilterSpec(
+        # Remove Weekends button
+        remove_weekends=remove_weekend(),
+        # Remove Holidays & Other Date Filters
+        holidays=remove_holiday(),
+        before_date=experiment_start_date if baseline else None,
+        # include all person types by default
+        person_types=include_persons(person_types),
+    )
+    return apply_filters(df, spec)
+
+def fingerprint_bytes(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def get_cached_clean_df(key):
+    # (df, door counts), or (None, None)
+    cleaned = cache_get('clean', key)
+    if cleaned is None:
+        return None, None
+    df, door_counts = cleaned
+    # hand out a copy - the tabs add columns to the frames they are given
+    return df.copy(), door_counts
+
+
+def put_cached_clean_df(key, df, door_counts):
+    df.attrs['fingerprint'] = key
+    cache_put('clean', key, (df.copy(), door_counts), clean_cache_max_entries, spill=True)
+
+
+def cached_report(report, df, *args, **inputs):
+    # one report per (dataset, filters, report, options) for every session - filtered frames carry a
+    # fingerprint derived from their FilterSpec, so the filter state is part of the key.
+    # inputs are other frames from the same upload as df (door_counts), so df's fingerprint covers them too.
+    # a report submit_report already started is waited for, not computed a second time. one that's still queued
+    # (behind an older rerun's or another session's reports) is taken off the queue & computed here instead
+    key = frame_key(df, report.__name__, *args)
+    with _pending_lock:
+        future = _pending_reports.get(key) if key is not None else None
+    if future is not None and not future.cancel():
+        return future.result()
+    return cached('report', key, lambda: report(df, *args, **inputs), report_cache_max_entries, spill=True)
+
+
+def _forget_report(key, future):
+    # done callback, also called when the future is cancelled. a finished report is in the cache by now
+    with _pending_lock:
+        if _pending_reports.get(key) is future:
+            del _pending_reports[key]
+
+
+def submit_report(report, df, *args, **inputs):
+    # queues cached_report(report, df, *args, **inputs) on the report pool, unless it's cached or already queued.
+    # returns its future, or None. stage timings of the background work aren't recorded - the tab's report
+    # stage shows the wait instead
+    key = frame_key(df, report.__name__, *args)
+    if key is None or cache_get('report', key) is not None:
+        return None
+    with _pending_lock:
+        future = _pending_reports.get(key)
+        if future is None:
+            future = _report_pool.submit(
+                cached, 'report', key, lambda: report(df, *args, **inputs), report_cache_max_entries, spill=True)
+            _pending_reports[key] = future
+    future.add_done_callback(functools.partial(_forget_report, key))
+    return future
+
+
+def submit_reports(reports):
+    # reports: (report, args, inputs) for submit_report, most wanted first. whatever this session queued on its
+    # previous run & doesn't ask for again (e.g. the reports of the filters it had before) is cancelled if it
+    # hasn't started yet
+    futures = [submit_report(report, *args, **inputs) for report, args, inputs in reports]
+    futures = [future for future in futures if future is not None]
+    for future in st.session_state.get('report_futures', []):
+        if future not in futures:
+            future.cancel()
+    st.session_state['report_futures'] = futures
+
+
+def load_cached_store():
+    # (stored df, its door counts)
+    df, door_counts = cached('store', store_fingerprint(), lambda: (load_store(), load_door_counts()),
+                             store_cache_max_entries)
+    # hand out a copy - the tabs add columns to the frames they are given
+    return df.copy(), door_counts
 
 
-def clean_df(df):
-    df = fix_headers(df)
-    df = remove_junk(df)
-    df = fix_dates(df)
-    df = anonymize(df)
-    df = count_one_swipe_per_day(df)
-    return df
-
 def upload_data_file():
+    # (cleaned df, its door counts, is_unlocked)
     is_unlocked = False
     baseline_df = None
-    uploaded_file = st.file_uploader("Upload data file (csv or xlsx)")
-
-    if uploaded_file is not None:
-        extension = uploaded_file.name.split('.')[-1]
-        # Can be used wherever a "file-like" object is accepted:
-        if extension == 'csv':
-            baseline_df = pd.read_csv(uploaded_file)
-        elif extension == 'xlsx':
-            baseline_df = pd.read_excel(uploaded_file)
-        else:
-            st.code("Incompatiable file. Try .csv or .xlsx")
-            return baseline_df, is_unlocked
-
-        # Required Headers - Extra will be handled and removed; Less will be rejected
-        min_required_headers = ['Access Date', 'CDSID', 'Person Type',]
-        baseline_df = fix_headers(baseline_df)
-
-        if all(item in baseline_df.columns.to_list() for item in min_required_headers):
-            is_unlocked = True
-            baseline_df = clean_df(baseline_df)
+    uploaded_files = st.file_uploader("Upload data files (csv or xlsx)", accept_multiple_files=True)
+    # new dates are appended to the monthly parquet store & the dashboard reads the full history back
+    use_store = st.radio("Add to stored history?", (True, False), 1, horizontal=True)
+    # exports without a Site column are tagged with this site
+    site = st.selectbox("Site of these exports", list(sites)) if len(sites) > 1 else default_site
+
+    if not uploaded_files:
+        if use_store and store_exists():
+            with stage('load store'):
+                return (*load_cached_store(), True)
+        return baseline_df, None, is_unlocked
+
+    # same bytes -> same cleaned frame, so skip parsing & cleaning on reruns
+    file_keys = [f'{site}:{fingerprint_bytes(uploaded_file.getvalue())}' for uploaded_file in uploaded_files]
+    upload_key = fingerprint_bytes(''.join(sorted(file_keys)).encode())
+    baseline_df, door_counts = get_cached_clean_df(upload_key)
+    if baseline_df is None:
+        baseline_df, door_counts, is_unlocked = read_data_files(uploaded_files, file_keys, site)
+        if not is_unlocked:
+            return baseline_df, door_counts, is_unlocked
+        put_cached_clean_df(upload_key, baseline_df, door_counts)
+
+    if use_store:
+        if cache_get('appended', (upload_key, store_fingerprint())) is None:
+            with stage('append to store', rows=len(baseline_df)):
+                append_to_store(baseline_df, door_counts)
+            cache_put('appended', (upload_key, store_fingerprint()), True, appended_cache_max_entries)
+        with stage('load store') as record:
+            baseline_df, door_counts = load_cached_store()
+            record['Rows'] = len(baseline_df)
+    return baseline_df, door_counts, True
+
+
+@timed('upload')
+def read_data_files(uploaded_files, file_keys, site=default_site):
+    # per file results are cached, so adding a file only ingests that file
+    partials = {key: cache_get('partial', key) for key in file_keys}
+    todo = [(key, uploaded_file) for key, uploaded_file in zip(file_keys, uploaded_files) if partials[key] is None]
+    with stage(f'parse & clean {len(todo)} file(s)'):
+        if len(todo) == 1:
+            key, uploaded_file = todo[0]
+            results = [clean_file(uploaded_file.name, uploaded_file.getvalue(), site)]
+        elif todo:
+            # each file is parsed & cleaned in its own process. not forked: the server is multithreaded (sessions,
+            # the report pool) & a fork taken while another thread holds a lock can deadlock the worker
+            with ProcessPoolExecutor(max_workers=min(len(todo), os.cpu_count() or 1),
+                                     mp_context=multiprocessing.get_context('forkserver')) as pool:
+                results = list(pool.map(clean_file, *zip(*[(f.name, f.getvalue(), site) for _, f in todo])))
         else:
-            st.code(f'TRY AGAIN! Required data columns are: Access Date, CDSID, Person Type')
+            results = []
+
+    for (key, uploaded_file), (df, door_counts, error) in zip(todo, results):
+        if error is not None:
+            st.code(f'{uploaded_file.name}: {error}')
+            continue
+        partials[key] = (df, door_counts)
+        cache_put('partial', key, partials[key], clean_cache_max_entries, spill=True)
+
+    # (df, door counts) per file
+    partials = [partial for partial in partials.values() if partial is not None]
+    if not partials:
+        return None, None, False
+    with stage('merge & dedup', rows=sum(len(df) for df, _ in partials)):
+        df, door_counts = finish_clean(partials)
+        return df, door_counts, True
 
-    return baseline_df, is_unlocked
 
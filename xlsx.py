@@ -0,0 +1,38 @@
+from itertools import islice
+import pandas as pd
+from openpyxl import load_workbook
+
+
+def _open_workbook(file):
+    file.seek(0)
+    # read-only streams the sheet xml instead of building the whole workbook object model
+    return load_workbook(file, read_only=True, data_only=True)
+
+
+def sheet_headers(file):
+    # first row of every sheet, by sheet name
+    workbook = _open_workbook(file)
+    try:
+        return {
+            sheet.title: [cell for cell in next(sheet.iter_rows(max_row=1, values_only=True), ())]
+            for sheet in workbook.worksheets
+        }
+    finally:
+        workbook.close()
+
+
+def iter_sheet_chunks(file, sheets, chunksize):
+    # sheets maps sheet name -> (usecols, dtype); yields frames of up to chunksize rows, sheet after sheet
+    workbook = _open_workbook(file)
+    try:
+        for sheet_name, (usecols, dtype) in sheets.items():
+            rows = workbook[sheet_name].iter_rows(values_only=True)
+            header = list(next(rows, ()))
+            positions = [header.index(column) for column in usecols]
+            while True:
+                chunk = [[row[i] if i < len(row) else None for i in positions] for row in islice(rows, chunksize)]
+                if not chunk:
+                    break
+                yield pd.DataFrame(chunk, columns=usecols).astype(dtype)
+    finally:
+        workbook.close()